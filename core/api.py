@@ -1,5 +1,7 @@
 import typing
 
+from .util.trace import tracer
+
 if typing.TYPE_CHECKING:
     from .extension import KairyoExtension
     from .user_interface import UserInterface
@@ -18,6 +20,11 @@ class KairyoApi:
     def extensions(self):
         return self.__extensions
 
+    @property
+    def tracer(self):
+        """Process-wide span / counter registry, see ``core.util.trace.Tracer``."""
+        return tracer
+
     @property
     def user_interface(self):
         return self.__user_interface
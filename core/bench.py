@@ -0,0 +1,278 @@
+"""
+Benchmarks the storage layer on synthetic projects.
+
+Generates a project of random images with a history of partially changed
+versions, times the common project / repository operations on it and prints
+the results as JSON (or writes them to ``--output``), tagged with the current
+commit so runs can be compared::
+
+    python -m core.bench --images 50 --size 1024 --snapshots 5 --change-ratio 0.1
+    python -m core.bench --output new.json --baseline old.json
+
+Nothing here imports Qt, the suite runs headless. Image contents are raw
+pixel-sized byte buffers, the storage layer never decodes them.
+"""
+import argparse
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import ujson
+
+from .project.project import Project
+from .util.filedict import FileDict
+
+
+class BenchConfig(NamedTuple):
+    images: int = 20
+    # width and height in pixels of the 3-channel images
+    size: int = 512
+    snapshots: int = 5
+    # share of rows rewritten between two versions of an image
+    change_ratio: float = 0.1
+    repeat: int = 3
+    seed: int = 0
+
+
+def _content(rng: random.Random, config: BenchConfig) -> bytearray:
+    return bytearray(rng.randbytes(config.size * config.size * 3))
+
+
+def _mutate(rng: random.Random, content: bytearray, config: BenchConfig) -> bytearray:
+    row = config.size * 3
+    content = bytearray(content)
+    for y in rng.sample(range(config.size), max(1, int(config.size * config.change_ratio))):
+        content[y * row:(y + 1) * row] = rng.randbytes(row)
+    return content
+
+
+def generate_project(path: str, config: BenchConfig) -> Dict[str, bytearray]:
+    """
+    Creates ``config.images`` images with ``config.snapshots`` snapshots each.
+
+    :return: the latest content of every image
+    """
+    rng = random.Random(config.seed)
+    project = Project(path)
+    latest = {}
+
+    for i in range(config.images):
+        name = f"image-{i:05d}"
+        image = project.create_image(name)
+        content = _content(rng, config)
+        for snapshot in range(config.snapshots):
+            if snapshot:
+                content = _mutate(rng, content, config)
+            image.update(content)
+            image.save_snapshot(f"version {snapshot}")
+        latest[name] = content
+
+    return latest
+
+
+def _result(samples: List[float], ops: int, nbytes: int = 0) -> dict:
+    """:param samples: seconds per repetition, each doing ``ops`` operations on ``nbytes`` bytes"""
+    best = min(samples)
+    result = {
+        'samples': samples,
+        'min_seconds': best,
+        'median_seconds': statistics.median(samples),
+        'ops': ops,
+        'ops_per_second': ops / best if best else None,
+    }
+    if nbytes:
+        result['mb_per_second'] = nbytes / best / 1e6 if best else None
+    return result
+
+
+def _time(func: Callable[[], None]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def run_suite(path: str, config: BenchConfig) -> Dict[str, dict]:
+    rng = random.Random(config.seed + 1)
+    results = {}
+
+    started = time.perf_counter()
+    latest = generate_project(path, config)
+    results['generate'] = _result([time.perf_counter() - started], config.images * config.snapshots)
+
+    names = sorted(latest)
+    image_bytes = config.size * config.size * 3
+
+    def open_project():
+        project = Project(path)
+        for name in names:
+            project.get_image(name).meta.time_created  # noqa
+
+    results['project_open'] = _result([_time(open_project) for _ in range(config.repeat)], len(names))
+
+    project = Project(path)
+    images = [project.get_image(name) for name in names]
+
+    update_samples, cold_samples, noop_samples = [], [], []
+    for _ in range(config.repeat):
+        contents = [bytes(_mutate(rng, latest[name], config)) for name in names]
+
+        def update():
+            for image, content in zip(images, contents):
+                image.update(content)
+
+        def save():
+            for image in images:
+                image.save_snapshot("bench")
+
+        update_samples.append(_time(update))
+        cold_samples.append(_time(save))
+        noop_samples.append(_time(save))
+
+    results['image_update'] = _result(update_samples, len(images), len(images) * image_bytes)
+    results['save_snapshot_cold'] = _result(cold_samples, len(images), len(images) * image_bytes)
+    results['save_snapshot_noop'] = _result(noop_samples, len(images))
+
+    oldest = [next(image.iter_history(newest_first=False))['hash'] for image in images]
+    newest = [image.history(limit=1)[0]['hash'] for image in images]
+
+    def checkout(snapshots):
+        def run():
+            for image, snapshot in zip(images, snapshots):
+                image.load_snapshot(snapshot)
+        return run
+
+    load_samples = []
+    for _ in range(config.repeat):
+        load_samples.append(_time(checkout(oldest)) + _time(checkout(newest)))
+    results['load_snapshot'] = _result(load_samples, 2 * len(images), 2 * len(images) * image_bytes)
+
+    history = [(image, header['hash']) for image in images for header in image.iter_history()]
+
+    def read_history():
+        for image, snapshot in history:
+            image.read_version(snapshot)
+
+    results['open_file_history'] = _result(
+        [_time(read_history) for _ in range(config.repeat)], len(history), len(history) * image_bytes
+    )
+
+    def map_history():
+        for image, snapshot in history:
+            image.map_version(snapshot).release()
+
+    results['map_file_history'] = _result(
+        [_time(map_history) for _ in range(config.repeat)], len(history), len(history) * image_bytes
+    )
+
+    results.update(_bench_filedict(path, config))
+    return results
+
+
+def _bench_filedict(path: str, config: BenchConfig, keys: int = 1000) -> Dict[str, dict]:
+    fn = os.path.join(path, "bench-filedict.json")
+    write_samples, batch_samples, read_samples = [], [], []
+
+    for _ in range(config.repeat):
+        if os.path.exists(fn):
+            os.remove(fn)
+        d = FileDict(fn)
+
+        def write():
+            for i in range(keys):
+                d[f"key-{i}"] = i
+
+        def write_batch():
+            with d.batch():
+                for i in range(keys):
+                    d[f"key-{i}"] = -i
+
+        def read():
+            fresh = FileDict(fn)
+            for i in range(keys):
+                fresh[f"key-{i}"]  # noqa
+
+        write_samples.append(_time(write))
+        batch_samples.append(_time(write_batch))
+        read_samples.append(_time(read))
+
+    return {
+        'filedict_write': _result(write_samples, keys),
+        'filedict_write_batch': _result(batch_samples, keys),
+        'filedict_read': _result(read_samples, keys),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict]) -> Dict[str, float]:
+    """:return: ``min_seconds`` of every benchmark relative to the baseline (< 1 is faster)"""
+    return {
+        name: result['min_seconds'] / baseline[name]['min_seconds']
+        for name, result in results.items()
+        if name in baseline and baseline[name]['min_seconds']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = BenchConfig()
+    parser.add_argument("--images", type=int, default=defaults.images)
+    parser.add_argument("--size", type=int, default=defaults.size, help="image width and height in pixels")
+    parser.add_argument("--snapshots", type=int, default=defaults.snapshots, help="snapshots per image")
+    parser.add_argument("--change-ratio", type=float, default=defaults.change_ratio,
+                        help="share of rows changed between versions")
+    parser.add_argument("--repeat", type=int, default=defaults.repeat)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--dir", help="where to generate the project, a temporary directory by default")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    # no-op snapshots are expected here, keep their warnings out of the output
+    logging.basicConfig(level=logging.ERROR)
+
+    config = BenchConfig(args.images, args.size, args.snapshots, args.change_ratio, args.repeat, args.seed)
+
+    if args.dir:
+        results = run_suite(args.dir, config)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_suite(tmp, config)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': config._asdict(),
+        'results': results,
+    }
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report['relative_to_baseline'] = compare(results, ujson.load(f)['results'])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            ujson.dump(report, f, indent=2)
+    else:
+        print(ujson.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
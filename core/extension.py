@@ -1,3 +1,8 @@
+import os
+from typing import NamedTuple, Optional
+
+import ujson
+
 from .api import KairyoApi
 
 
@@ -7,3 +12,52 @@ class KairyoExtension:
 
     def on_start(self):
         pass
+
+
+class ExtensionManifest(NamedTuple):
+    """
+    Contents of ``extensions/<name>/extension.json``.
+
+    ``entry`` is ``"<module>:<class>"`` with the module relative to the
+    extension package. ``activation`` is ``"startup"`` or ``"tab"``: the latter
+    only shows a tab titled ``tab`` and imports the extension once it is first
+    opened.
+    """
+
+    FILENAME = "extension.json"
+    ACTIVATION_STARTUP = "startup"
+    ACTIVATION_TAB = "tab"
+
+    name: str
+    package: str
+    entry: str
+    activation: str = ACTIVATION_STARTUP
+    tab: Optional[str] = None
+
+    @classmethod
+    def load(cls, path: str) -> 'ExtensionManifest':
+        """:param path: extension directory"""
+        with open(os.path.join(path, cls.FILENAME), encoding="utf-8") as f:
+            data = ujson.load(f)
+
+        manifest = cls(
+            name=data.get('name', os.path.basename(path)),
+            package=f"extensions.{os.path.basename(path)}",
+            entry=data['entry'],
+            activation=data.get('activation', cls.ACTIVATION_STARTUP),
+            tab=data.get('tab'),
+        )
+
+        if manifest.activation not in (cls.ACTIVATION_STARTUP, cls.ACTIVATION_TAB):
+            raise ValueError(f"unknown activation \"{manifest.activation}\" in {path}")
+        if manifest.activation == cls.ACTIVATION_TAB and not manifest.tab:
+            raise ValueError(f"tab activation without a tab title in {path}")
+        return manifest
+
+    @property
+    def module(self) -> str:
+        return f"{self.package}.{self.entry.split(':')[0]}"
+
+    @property
+    def class_name(self) -> str:
+        return self.entry.split(':')[1]
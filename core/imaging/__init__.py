@@ -0,0 +1,3 @@
+from .decode import decode, qimage_to_array
+from .diff import DiffResult, diff_arrays, diff_versions, score_history, score_project
+from .pyramid import TilePyramid
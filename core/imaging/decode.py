@@ -0,0 +1,35 @@
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt
+
+
+def qimage_to_array(image: QtGui.QImage) -> np.ndarray:
+    """Copies a QImage into a ``(height, width, 3)`` uint8 RGB array."""
+    image = image.convertToFormat(QtGui.QImage.Format_RGB888)
+    width, height = image.width(), image.height()
+
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+
+    # rows are padded to bytesPerLine
+    rows = np.frombuffer(ptr, np.uint8).reshape(height, image.bytesPerLine())
+    return rows[:, :width * 3].reshape(height, width, 3).copy()
+
+
+def decode(data: Union[bytes, memoryview], size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Decodes image bytes (or any buffer, e.g. a mapped file) into a ``(height, width, 3)`` uint8 RGB array. Works
+    without a QApplication, so it can be used headless.
+
+    :param size: ``(width, height)`` to resample the image to
+    """
+    image = QtGui.QImage.fromData(data)
+    if image.isNull():
+        raise ValueError("cannot decode image")
+
+    if size is not None and (image.width(), image.height()) != tuple(size):
+        image = image.scaled(size[0], size[1], Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    return qimage_to_array(image)
@@ -0,0 +1,230 @@
+import math
+from typing import TYPE_CHECKING, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..util.lru import ByteLRUCache
+from .decode import decode
+
+if TYPE_CHECKING:
+    from ..project.batch import ProgressCallback, BatchResult
+    from ..project.image import ProjectImage
+    from ..project.project import Project
+
+_ROWS_PER_CHUNK = 512
+_SSIM_WINDOW = 7
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+class DiffResult(NamedTuple):
+    mse: float
+    psnr: float
+    ssim: float
+    # share of pixels whose largest channel difference is above the threshold
+    changed_ratio: float
+    # (x, y, width, height) of changed regions, largest first
+    boxes: List[Tuple[int, int, int, int]]
+    # (height, width) uint8, largest absolute channel difference per pixel
+    heatmap: np.ndarray
+
+
+# results are keyed by the (blob, blob) pair, shared by the comparer and batch scoring
+_cache = ByteLRUCache(256 * 1024 * 1024, lambda result: result.heatmap.nbytes)
+
+
+def _heatmap_and_mse(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, float]:
+    height, width, channels = a.shape
+    heatmap = np.empty((height, width), np.uint8)
+    squared = 0
+
+    # chunked, so the int16 intermediates stay small on very large images
+    for y in range(0, height, _ROWS_PER_CHUNK):
+        delta = np.abs(a[y:y + _ROWS_PER_CHUNK].astype(np.int16) - b[y:y + _ROWS_PER_CHUNK])
+        heatmap[y:y + _ROWS_PER_CHUNK] = delta.max(axis=2)
+        squared += int(np.einsum('ijk,ijk->', delta, delta, dtype=np.int64))
+
+    return heatmap, squared / (height * width * channels)
+
+
+def _luminance(a: np.ndarray) -> np.ndarray:
+    # downsample like the reference SSIM implementation, so the window sees ~256px
+    factor = max(1, round(min(a.shape[:2]) / 256))
+    height, width = a.shape[0] // factor * factor, a.shape[1] // factor * factor
+
+    y = a[:height, :width].astype(np.float32) @ np.array([0.299, 0.587, 0.114], np.float32)
+    if factor > 1:
+        y = y.reshape(height // factor, factor, width // factor, factor).mean(axis=(1, 3))
+    return y.astype(np.float64)
+
+
+def _box_mean(x: np.ndarray, k: int) -> np.ndarray:
+    c = np.pad(x.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def _ssim(a: np.ndarray, b: np.ndarray) -> float:
+    x, y = _luminance(a), _luminance(b)
+    k = min(_SSIM_WINDOW, *x.shape)
+
+    mu_x, mu_y = _box_mean(x, k), _box_mean(y, k)
+    var_x = _box_mean(x * x, k) - mu_x * mu_x
+    var_y = _box_mean(y * y, k) - mu_y * mu_y
+    cov = _box_mean(x * y, k) - mu_x * mu_y
+
+    ssim = ((2 * mu_x * mu_y + _SSIM_C1) * (2 * cov + _SSIM_C2)) / \
+           ((mu_x * mu_x + mu_y * mu_y + _SSIM_C1) * (var_x + var_y + _SSIM_C2))
+    return float(ssim.mean())
+
+
+def _boxes(mask: np.ndarray, cell: int) -> List[Tuple[int, int, int, int]]:
+    height, width = mask.shape
+
+    # coarse grid of cells containing any change, then connected components on the grid
+    padded = np.pad(mask, ((0, -height % cell), (0, -width % cell)))
+    cells = padded.reshape(padded.shape[0] // cell, cell, padded.shape[1] // cell, cell)
+    grid = cells.any(axis=(1, 3))
+
+    ys, xs = np.nonzero(grid)
+    if not len(ys):
+        return []
+
+    # runs of changed cells along each grid row, row-major like the cells
+    starts = np.ones(len(ys), bool)
+    starts[1:] = (ys[1:] != ys[:-1]) | (xs[1:] != xs[:-1] + 1)
+    ends = np.append(starts[1:], True)
+    cell_runs = np.cumsum(starts) - 1
+    run_y, run_x0, run_x1 = ys[starts], xs[starts], xs[ends]
+
+    # a run touches the runs of the row above that end at or after its start - 1 and start at
+    # or before its end + 1 (diagonals included), found by bisecting row-major keys
+    stride = grid.shape[1] + 2
+    lo = np.searchsorted(run_y * stride + run_x1, (run_y - 1) * stride + run_x0 - 1, 'left')
+    hi = np.searchsorted(run_y * stride + run_x0, (run_y - 1) * stride + run_x1 + 1, 'right')
+    counts = np.maximum(hi - lo, 0)
+    a = np.repeat(np.arange(len(run_y)), counts)
+    b = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    # union-find over all touching pairs at once: hook the larger root to the smaller, then flatten
+    labels = np.arange(len(run_y))
+    while True:
+        root_a, root_b = labels[a], labels[b]
+        split = root_a != root_b
+        if not split.any():
+            break
+        np.minimum.at(labels, np.maximum(root_a[split], root_b[split]), np.minimum(root_a[split], root_b[split]))
+        while True:
+            flattened = labels[labels]
+            if np.array_equal(flattened, labels):
+                break
+            labels = flattened
+
+    # changed pixel extents of every cell, merged per component into tight boxes
+    rows = cells.any(axis=3)[ys, :, xs]
+    cols = cells.any(axis=1)[ys, xs, :]
+    top = ys * cell + rows.argmax(axis=1)
+    bottom = ys * cell + cell - 1 - rows[:, ::-1].argmax(axis=1)
+    left = xs * cell + cols.argmax(axis=1)
+    right = xs * cell + cell - 1 - cols[:, ::-1].argmax(axis=1)
+
+    _, components = np.unique(labels[cell_runs], return_inverse=True)
+    count = components.max() + 1
+    y0, x0 = np.full(count, padded.shape[0]), np.full(count, padded.shape[1])
+    y1, x1 = np.zeros(count, int), np.zeros(count, int)
+    np.minimum.at(y0, components, top)
+    np.minimum.at(x0, components, left)
+    np.maximum.at(y1, components, bottom)
+    np.maximum.at(x1, components, right)
+
+    width, height = x1 - x0 + 1, y1 - y0 + 1
+    order = np.argsort(-(width * height), kind='stable')
+    return [(int(x0[i]), int(y0[i]), int(width[i]), int(height[i])) for i in order]
+
+
+def diff_arrays(a: np.ndarray, b: np.ndarray, threshold: int = 8, cell: int = 16) -> DiffResult:
+    """
+    Compares two ``(height, width, 3)`` uint8 images of the same size.
+
+    :param threshold: channel difference above which a pixel counts as changed
+    :param cell: grid size used to group changed pixels into regions
+    """
+    if a.shape != b.shape:
+        raise ValueError(f"shape mismatch: {a.shape} != {b.shape}")
+
+    heatmap, mse = _heatmap_and_mse(a, b)
+    psnr = math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+    mask = heatmap > threshold
+    changed_ratio = float(np.count_nonzero(mask)) / mask.size
+
+    return DiffResult(
+        mse=mse,
+        psnr=psnr,
+        ssim=_ssim(a, b) if mse else 1.0,
+        changed_ratio=changed_ratio,
+        boxes=_boxes(mask, cell) if changed_ratio else [],
+        heatmap=heatmap,
+    )
+
+
+def diff_versions(image: 'ProjectImage', snapshot_a: Optional[str], snapshot_b: Optional[str]) -> DiffResult:
+    """
+    Compares two versions of an image (None is the working file). The second
+    version is resampled to the size of the first one if they differ.
+    """
+    key = (image.version_id(snapshot_a), image.version_id(snapshot_b))
+    cacheable = all(key)
+
+    result = _cache.get(key) if cacheable else None
+    if result is None:
+        with image.map_version(snapshot_a) as data:
+            a = decode(data)
+        with image.map_version(snapshot_b) as data:
+            b = decode(data, (a.shape[1], a.shape[0]))
+        result = diff_arrays(a, b)
+        if cacheable:
+            _cache.put(key, result)
+
+    return result
+
+
+def score_history(image: 'ProjectImage') -> List[dict]:
+    """Scores every snapshot of an image against its parent, oldest first."""
+    scores = []
+    for header in image.iter_history(newest_first=False):
+        parent = header['parent']
+        if parent is None:
+            continue
+        try:
+            result = diff_versions(image, parent, header['hash'])
+        except (FileNotFoundError, ValueError):
+            continue
+
+        scores.append({
+            'snapshot': header['hash'],
+            'parent': parent,
+            'mse': result.mse,
+            'psnr': result.psnr,
+            'ssim': result.ssim,
+            'changed_ratio': result.changed_ratio,
+            'regions': len(result.boxes),
+        })
+
+    return scores
+
+
+def score_project(
+        project: 'Project',
+        names: Optional[Iterable[str]] = None,
+        workers: Optional[int] = None,
+        progress: Optional['ProgressCallback'] = None,
+) -> List['BatchResult']:
+    """Runs ``score_history`` for every image (all by default) in parallel, NumPy releases the GIL."""
+    from ..project.batch import run_batch
+
+    names = project.names if names is None else list(names)
+    return run_batch(project, score_history, [(name, ()) for name in names], workers, progress=progress)
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,166 @@
+import math
+import os
+import shutil
+import tempfile
+from typing import Callable, Iterator, Tuple, Union
+
+import ujson
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtCore import Qt
+
+
+class TilePyramid:
+    """
+    On-disk multi-resolution tile pyramid of one image version.
+
+    Level 0 is the full resolution, every next level halves both dimensions
+    until the image fits in a single tile. Tiles are ``<level>/<x>_<y>.png``
+    under the pyramid directory, ``pyramid.json`` describes the layout and is
+    only present once every tile has been written.
+    """
+
+    TILE_SIZE = 512
+    _META_FILENAME = "pyramid.json"
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, path: str):
+        self._path = path
+
+        with open(os.path.join(path, self._META_FILENAME), encoding="utf-8") as f:
+            meta = ujson.load(f)
+
+        self._width = meta['width']
+        self._height = meta['height']
+        self._tile_size = meta['tile_size']
+        self._levels = meta['levels']
+
+    # ---------------------- Public Methods ----------------------
+
+    @classmethod
+    def open_or_build(cls, path: str, read: Callable[[], Union[bytes, memoryview]], tile_size: int = TILE_SIZE
+                      ) -> 'TilePyramid':
+        """
+        :param read: returns the encoded image (bytes or a buffer), only called if the pyramid has to be built
+        """
+        if os.path.isfile(os.path.join(path, cls._META_FILENAME)):
+            return cls(path)
+        return cls.build(path, read(), tile_size)
+
+    @classmethod
+    def build(cls, path: str, data: Union[bytes, memoryview], tile_size: int = TILE_SIZE) -> 'TilePyramid':
+        image = QtGui.QImage.fromData(data)
+        if image.isNull():
+            raise ValueError("cannot decode image")
+
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+
+        # built aside and renamed into place, concurrent builders of the same blob don't collide
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            width, height = image.width(), image.height()
+            level = 0
+            while True:
+                level_path = os.path.join(tmp_path, str(level))
+                os.makedirs(level_path)
+
+                for ty in range(math.ceil(image.height() / tile_size)):
+                    for tx in range(math.ceil(image.width() / tile_size)):
+                        x, y = tx * tile_size, ty * tile_size
+                        tile = image.copy(x, y, min(tile_size, image.width() - x), min(tile_size, image.height() - y))
+                        tile.save(os.path.join(level_path, f"{tx}_{ty}.png"), "PNG")
+
+                if image.width() <= tile_size and image.height() <= tile_size:
+                    break
+
+                image = image.scaled(max(1, image.width() // 2), max(1, image.height() // 2),
+                                     Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                level += 1
+
+            with open(os.path.join(tmp_path, cls._META_FILENAME), "w", encoding="utf-8") as f:
+                ujson.dump({'width': width, 'height': height, 'tile_size': tile_size, 'levels': level + 1}, f)
+
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                if not os.path.isfile(os.path.join(path, cls._META_FILENAME)):
+                    raise
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+        return cls(path)
+
+    def level_size(self, level: int) -> Tuple[int, int]:
+        width, height = self._width, self._height
+        for _ in range(level):
+            width, height = max(1, width // 2), max(1, height // 2)
+        return width, height
+
+    def level_for_scale(self, scale: float) -> int:
+        """Coarsest level that still has at least ``scale`` source pixels per displayed pixel."""
+        if scale >= 1:
+            return 0
+        return min(self._levels - 1, int(math.floor(math.log2(1 / scale))))
+
+    def tiles_in(self, level: int, rect: QtCore.QRect) -> Iterator[Tuple[int, int]]:
+        """Tiles of ``level`` intersecting ``rect`` (in that level's pixels)."""
+        width, height = self.level_size(level)
+        rect = rect.intersected(QtCore.QRect(0, 0, width, height))
+        if rect.isEmpty():
+            return
+
+        for ty in range(rect.top() // self._tile_size, rect.bottom() // self._tile_size + 1):
+            for tx in range(rect.left() // self._tile_size, rect.right() // self._tile_size + 1):
+                yield tx, ty
+
+    def tile_rect(self, level: int, tx: int, ty: int) -> QtCore.QRect:
+        width, height = self.level_size(level)
+        x, y = tx * self._tile_size, ty * self._tile_size
+        return QtCore.QRect(x, y, min(self._tile_size, width - x), min(self._tile_size, height - y))
+
+    def tile_path(self, level: int, tx: int, ty: int) -> str:
+        return os.path.join(self._path, str(level), f"{tx}_{ty}.png")
+
+    def tile(self, level: int, tx: int, ty: int) -> QtGui.QImage:
+        return QtGui.QImage(self.tile_path(level, tx, ty))
+
+    def preview(self, max_size: int) -> QtGui.QImage:
+        """Stitches the finest level whose larger side is at most ``max_size``."""
+        level = 0
+        while level < self._levels - 1 and max(self.level_size(level)) > max_size:
+            level += 1
+
+        width, height = self.level_size(level)
+        image = QtGui.QImage(width, height, QtGui.QImage.Format_ARGB32)
+        image.fill(Qt.transparent)
+
+        painter = QtGui.QPainter(image)
+        for tx, ty in self.tiles_in(level, QtCore.QRect(0, 0, width, height)):
+            painter.drawImage(self.tile_rect(level, tx, ty).topLeft(), self.tile(level, tx, ty))
+        painter.end()
+
+        return image
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    @property
+    def levels(self):
+        return self._levels
@@ -0,0 +1,113 @@
+import concurrent.futures
+import os
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .project import Project
+
+
+class BatchResult(NamedTuple):
+    name: str
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+ProgressCallback = Callable[[int, int, BatchResult], None]
+
+
+def _run(project: 'Project', op: Union[str, Callable], name: str, args: tuple):
+    if callable(op):
+        return op(project.get_image(name), *args)
+
+    if op == "create_image":
+        content, = args
+        image = project.create_image(name)
+        if content is not None:
+            image.update(content)
+        return None
+
+    image = project.get_image(name)
+    if op == "save_snapshot":
+        return image.save_snapshot(*args)
+    if op == "update":
+        return image.update(*args)
+
+    raise ValueError(f"unknown batch operation \"{op}\"")
+
+
+# the project of a batch worker process, opened once by ``_init_process`` and used for all its tasks
+_process_project: Optional['Project'] = None
+
+
+def _init_process(root_dir: str):
+    global _process_project
+    from .project import Project
+
+    # the index is the parent's to sync
+    _process_project = Project(root_dir, max_resident_images=1, sync_index=False)
+
+
+def _run_in_process(op: Union[str, Callable], name: str, args: tuple):
+    return _run(_process_project, op, name, args)
+
+
+def run_batch(
+        project: 'Project',
+        op: Union[str, Callable],
+        jobs: Iterable[Tuple[str, tuple]],
+        workers: Optional[int] = None,
+        processes: bool = False,
+        progress: Optional[ProgressCallback] = None,
+) -> List[BatchResult]:
+    """
+    Runs ``op`` for every ``(image name, args)`` job on a thread or process pool.
+
+    ``op`` is either the name of a built-in operation or a callable taking the
+    ``ProjectImage`` and ``args`` (module-level, if ``processes`` is set).
+
+    Hashing and file I/O release the GIL, so threads scale across cores for
+    snapshots; ``processes=True`` also parallelizes the Python-side work.
+    ``progress`` is called from the calling thread as jobs finish.
+
+    :return: one result per job, in job order
+    """
+    jobs = list(jobs)
+    names = [name for name, _ in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("every image can only appear once per batch")
+
+    workers = workers or min(32, os.cpu_count() or 1)
+    results: List[Optional[BatchResult]] = [None] * len(jobs)
+
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_process, initargs=(project.root_dir,)
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        futures = {}
+        for i, (name, args) in enumerate(jobs):
+            if processes:
+                future = executor.submit(_run_in_process, op, name, args)
+            else:
+                future = executor.submit(_run, project, op, name, args)
+            futures[future] = i
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                result = BatchResult(names[i], future.result())
+            except Exception as e:
+                result = BatchResult(names[i], error=e)
+
+            results[i] = result
+            if progress is not None:
+                progress(done, len(jobs), result)
+
+    return results
@@ -1,14 +1,21 @@
+import hashlib
 import os.path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, BinaryIO, Optional, Tuple, Union
+
+import ujson
 
 from ..util.filedict import NamedFileDict, field
 from ..vcs import Repository
+from ..vcs.store import MIN_AGE
+from ..vcs.tasks import FileProgressCallback, Task
 
 if TYPE_CHECKING:
     from .project import Project
 
 
 class ImageMeta(NamedFileDict):
+    _MAX_AGE = 1.0
+
     time_created: float = field()
     time_upscaled: float = field()
 
@@ -26,27 +33,119 @@ class ProjectImage:
         os.makedirs(self._full_path, exist_ok=True)
 
         self._meta = ImageMeta(os.path.join(self._full_path, "meta.json"))
-        self._vcs = Repository(self._full_path)
+        self._vcs = Repository(self._full_path, self._parent.store)
+
+        self._meta.subscribe(self._on_meta_changed)
+        self._vcs.subscribe(self._on_history_changed)
 
     # ---------------------- Public Methods ----------------------
 
-    def update(self, content: bytes):
-        with open(os.path.join(self._full_path, "image.png"), 'wb') as f:
-            f.write(content)
+    def update(self, content: Union[bytes, bytearray, memoryview, BinaryIO]):
+        """
+        Atomically replaces the working image.
+
+        :param content: any buffer-protocol object or a readable binary stream
+        """
+        self._vcs.write_file(os.path.join(self._full_path, "image.png"), content)
+
+    def save_snapshot(self, description: str = "", rehash: bool = False):
+        self._vcs.save_snapshot(description, rehash)
+
+    def save_snapshot_async(self, description: str = "", rehash: bool = False,
+                            progress: Optional[FileProgressCallback] = None) -> Task:
+        """See ``Repository.save_snapshot_async``, cancelling leaves the history as it was."""
+        return self._vcs.save_snapshot_async(description, rehash, progress)
+
+    def load_snapshot(self, snapshot: str):
+        self._vcs.load_snapshot(snapshot)
+
+    def load_snapshot_async(self, snapshot: str, progress: Optional[FileProgressCallback] = None) -> Task:
+        """See ``Repository.load_snapshot_async``, cancelling restores the files written so far."""
+        return self._vcs.load_snapshot_async(snapshot, progress=progress)
+
+    def repack(self, full: bool = False):
+        return self._vcs.repack(full)
 
-    def save_snapshot(self, description: str = ""):
-        self._vcs.save_snapshot(description)
+    def gc(self, min_age: float = MIN_AGE):
+        return self._vcs.gc(min_age)
+
+    def history(self, limit: int = None, offset: int = 0):
+        """Snapshot headers, newest first, see ``Repository.history``."""
+        return self._vcs.history(limit, offset)
+
+    def iter_history(self, newest_first: bool = True):
+        return self._vcs.iter_history(newest_first)
 
     def read_version(self, snapshot: str = None):
         with self._vcs.open_file(os.path.join(self._full_path, "image.png"), snapshot) as f:
             return f.read()
 
+    def map_version(self, snapshot: str = None) -> memoryview:
+        """
+        Like ``read_version``, but returns a read-only memoryview backed by the
+        mapped file or blob where possible. Use it in a ``with`` block or
+        ``release`` it, the mapping stays open as long as the view does.
+        """
+        return self._vcs.map_file(os.path.join(self._full_path, "image.png"), snapshot)
+
+    def version_id(self, snapshot: str = None):
+        """Content hash of the image in a snapshot (or of the working file, if known)."""
+        return self._vcs.file_id(os.path.join(self._full_path, "image.png"), snapshot)
+
+    def pyramid(self, snapshot: str = None):
+        """Tile pyramid of a version for deep zoom, built on first use and cached in the repository."""
+        from ..imaging.pyramid import TilePyramid
+
+        data = None
+        file_id = self.version_id(snapshot)
+        if file_id is None:
+            data = self.map_version(snapshot)
+            file_id = hashlib.sha256(data).hexdigest()
+
+        return TilePyramid.open_or_build(
+            self._vcs.cache_path("pyramids", file_id), lambda: data if data is not None else self.map_version(snapshot)
+        )
+
+    def reindex(self):
+        self._on_history_changed(self._vcs)
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _on_meta_changed(self, data: dict):
+        self._parent.index.update_meta(self._name, data)
+
+    def _on_history_changed(self, repository: Repository):
+        # meta.json is part of the tree, a checkout may have replaced it
+        self._meta.invalidate()
+        self._parent.index.update_meta(self._name, self._meta.to_dict())
+        self._parent.index.update_history(self._name, repository.snapshot_count, repository.last_snapshot_time)
+
+    # ---------------------- Static Methods ----------------------
+
+    @staticmethod
+    def read_summary(path: str) -> Tuple[dict, int, Optional[float]]:
+        """
+        Metadata, snapshot count and newest snapshot time of the image at ``path``,
+        read from its files without opening it (nothing is created or migrated).
+        """
+        try:
+            with open(os.path.join(path, "meta.json"), 'r', encoding="utf-8") as f:
+                meta = ujson.load(f)
+        except FileNotFoundError:
+            meta = {}
+
+        return (meta, *Repository.read_summary(path))
+
     # ------------------------ Properties ------------------------
 
     @property
-    def meta(self) -> ImageMeta:
-        return self._meta
+    def repository(self):
+        return self._vcs
 
     @property
-    def history(self):
-        return self._vcs.history
+    def name(self):
+        return self._name
+
+    @property
+    def meta(self) -> ImageMeta:
+        return self._meta
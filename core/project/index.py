@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+
+
+class ProjectIndex:
+    """
+    Queryable sqlite copy of every image's metadata and snapshot summary.
+
+    The files under ``images/`` stay the source of truth; the index is kept in
+    sync by ``ProjectImage`` and can always be rebuilt from them.
+    """
+
+    _SCHEMA_VERSION = 1
+    _COLUMNS = ('time_created', 'time_upscaled', 'snapshot_count', 'time_snapshot')
+    _META_COLUMNS = ('time_created', 'time_upscaled')
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, fn: str):
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(fn, timeout=30, check_same_thread=False, isolation_level=None)
+
+        with self._lock:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != self._SCHEMA_VERSION:
+                self._db.executescript(f"""
+                    DROP TABLE IF EXISTS images;
+                    CREATE TABLE images (
+                        name TEXT PRIMARY KEY,
+                        time_created REAL,
+                        time_upscaled REAL,
+                        snapshot_count INTEGER NOT NULL DEFAULT 0,
+                        time_snapshot REAL
+                    );
+                    CREATE INDEX images_time_created ON images (time_created);
+                    CREATE INDEX images_time_upscaled ON images (time_upscaled);
+                    CREATE INDEX images_snapshot_count ON images (snapshot_count);
+                    CREATE INDEX images_time_snapshot ON images (time_snapshot);
+                    PRAGMA user_version = {self._SCHEMA_VERSION};
+                """)
+
+    # ---------------------- Public Methods ----------------------
+
+    def update_meta(self, name: str, meta: dict):
+        values = [meta.get(column) for column in self._META_COLUMNS]
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO images (name, {', '.join(self._META_COLUMNS)}) VALUES (?, ?, ?) "
+                f"ON CONFLICT (name) DO UPDATE SET "
+                f"{', '.join(f'{c} = excluded.{c}' for c in self._META_COLUMNS)}",
+                [name, *values]
+            )
+
+    def update_history(self, name: str, snapshot_count: int, time_snapshot: Optional[float]):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO images (name, snapshot_count, time_snapshot) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "snapshot_count = excluded.snapshot_count, time_snapshot = excluded.time_snapshot",
+                [name, snapshot_count, time_snapshot]
+            )
+
+    def add(self, name: str, meta: dict, snapshot_count: int, time_snapshot: Optional[float]):
+        """Adds an image unless it is indexed already, e.g. by an update made meanwhile."""
+        values = [meta.get(column) for column in self._META_COLUMNS]
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO images (name, {', '.join(self._META_COLUMNS)}, snapshot_count, time_snapshot) "
+                f"VALUES (?, ?, ?, ?, ?) ON CONFLICT (name) DO NOTHING",
+                [name, *values, snapshot_count, time_snapshot]
+            )
+
+    def remove(self, names: Iterable[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM images WHERE name = ?", [(name,) for name in names])
+
+    def names(self) -> set:
+        with self._lock:
+            return set(row[0] for row in self._db.execute("SELECT name FROM images"))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM images")
+
+    def query(
+            self,
+            order_by: Optional[str] = None,
+            descending: bool = False,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            **filters,
+    ) -> List[str]:
+        """
+        :param order_by: one of the indexed columns (``time_created``, ``time_upscaled``,
+            ``snapshot_count``, ``time_snapshot``) or ``name``
+        :param filters: ``<column>__<op>=value`` with op one of ``eq``, ``ne``, ``lt``, ``le``,
+            ``gt``, ``ge``, ``isnull`` (value is a bool)
+        :return: matching image names
+        """
+        ops = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+        where = []
+        params = []
+        for key, value in filters.items():
+            column, _, op = key.rpartition("__")
+            self._check_column(column)
+            if op == 'isnull':
+                where.append(f"{column} IS {'' if value else 'NOT '}NULL")
+            elif op in ops:
+                where.append(f"{column} {ops[op]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"unknown filter \"{key}\"")
+
+        sql = "SELECT name FROM images"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order_by:
+            self._check_column(order_by, allow_name=True)
+            sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}, name"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, params)]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _check_column(self, column: str, allow_name: bool = False):
+        if column not in self._COLUMNS and not (allow_name and column == "name"):
+            raise ValueError(f"unknown column \"{column}\"")
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def path(self):
+        return self._fn
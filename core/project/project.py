@@ -1,34 +1,324 @@
+import collections
+import logging
 import os
+import threading
 import time
-from typing import Union, Dict
+from typing import Union, Set, Iterable, Mapping, Optional, List, Callable, Dict
 
+from core.project.batch import BatchResult, ProgressCallback, run_batch
 from core.project.image import ProjectImage
+from core.project.index import ProjectIndex
+from core.util.filedict import NamedFileDict, field
+from core.vcs.fsck import FsckResult, verify_blobs
+from core.vcs.shared import SharedBlobStore
+from core.vcs.store import MIN_AGE
+
+
+def _gc_image(image: ProjectImage, min_age: float) -> int:
+    return image.gc(min_age)
+
+
+def _refresh_refs(image: ProjectImage):
+    image.repository.refresh_refs()
+
+
+def _prune_cache(image: ProjectImage):
+    image.repository.prune_cache()
+
+
+def _fsck_plan(image: ProjectImage):
+    repo = image.repository
+    reachable = repo.reachable()
+    present = set(file_id for file_id in reachable if repo.store.contains(file_id))
+    return repo.store.path, present, sorted(reachable - present)
+
+
+def _raise_failures(results: List[BatchResult], action: str):
+    failed = [result for result in results if not result.ok]
+    if failed:
+        raise RuntimeError(
+            f"{action} failed for {len(failed)} image(s): {', '.join(result.name for result in failed)}"
+        ) from failed[0].error
+
+
+class ProjectMeta(NamedFileDict):
+    _MAX_AGE = 1.0
+
+    # all images keep their blobs in one store under store/ instead of their own .vcs
+    shared_store: bool = field(default=False)
 
 
 class Project:
+    _MAX_RESIDENT_IMAGES = 256
 
-    def __init__(self, path: Union[str, os.PathLike]):
+    def __init__(self, path: Union[str, os.PathLike], max_resident_images: int = _MAX_RESIDENT_IMAGES,
+                 sync_index: bool = True):
+        """
+        :param sync_index: bring the project index up to date with images/, images
+            it lacks are indexed on a background thread (see ``wait_for_index``)
+        """
         self._root_dir = os.path.abspath(path)
         self._images_dir = os.path.join(self._root_dir, "images")
 
         os.makedirs(self._root_dir, exist_ok=True)
         os.makedirs(self._images_dir, exist_ok=True)
 
-        self._images: Dict[str, ProjectImage] = dict()
-        for dir_name in os.listdir(self._images_dir):
-            self._images[dir_name] = ProjectImage(self, dir_name)
+        self._meta = ProjectMeta(os.path.join(self._root_dir, "project.json"))
+        self._store: Optional[SharedBlobStore] = None
+        if self._meta.shared_store:
+            self._store = SharedBlobStore(os.path.join(self._root_dir, "store"))
+
+        # images are only materialized on first access, at most max_resident_images stay loaded
+        self._max_resident_images = max_resident_images
+        self._names: Set[str] = set(
+            entry.name for entry in os.scandir(self._images_dir) if entry.is_dir()
+        )
+        self._images: 'collections.OrderedDict[str, ProjectImage]' = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+        self._index = ProjectIndex(os.path.join(self._root_dir, "index.sqlite"))
+        self._index_thread: Optional[threading.Thread] = None
+        if sync_index:
+            self._sync_index()
 
     def create_image(self, name: str):
-        if name in self._images:
-            raise ValueError(f"image with name \"{name}\" already exists")
+        with self._lock:
+            if name in self._names:
+                raise ValueError(f"image with name \"{name}\" already exists")
+            self._names.add(name)
 
         image = ProjectImage(self, name)
         image.meta.time_created = time.time()
 
+        with self._lock:
+            self._remember(name, image)
+
         return image
 
     def get_image(self, name: str):
-        return self._images[name]
+        with self._lock:
+            try:
+                image = self._images[name]
+            except KeyError:
+                if name not in self._names:
+                    raise
+                image = ProjectImage(self, name)
+
+            self._remember(name, image)
+            return image
+
+    def find_images(
+            self,
+            order_by: Optional[str] = None,
+            descending: bool = False,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            **filters,
+    ) -> List[str]:
+        """
+        Queries the project index, e.g.
+        ``find_images(order_by="time_created", descending=True, time_upscaled__isnull=False)``.
+        See ``ProjectIndex.query``.
+        """
+        return self._index.query(order_by, descending, limit, offset, **filters)
+
+    def enable_shared_store(self):
+        """
+        Switches the project to a single blob store shared by all images, so
+        identical files are stored once. Every image moves its blobs over the
+        next time it is opened; image handles taken before switch to the shared
+        store along with it.
+        """
+        if self._store is not None:
+            return
+
+        self._store = SharedBlobStore(os.path.join(self._root_dir, "store"))
+        self._meta.shared_store = True
+
+        # reopened with the shared store on next access
+        with self._lock:
+            self._images.clear()
+
+    def rebuild_index(self):
+        """Rebuilds the project index from the files of every image, in the calling thread."""
+        self.wait_for_index()
+        self._index.clear()
+        self._index_images(self.names)
+
+    def wait_for_index(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the background indexing started on open, if any.
+
+        :return: whether the index is complete
+        """
+        if self._index_thread is not None:
+            self._index_thread.join(timeout)
+            return not self._index_thread.is_alive()
+        return True
+
+    def _sync_index(self):
+        indexed = self._index.names()
+
+        self._index.remove(indexed - self._names)
+
+        # e.g. a new index or images copied in from outside, opening stays instant
+        missing = sorted(self._names - indexed)
+        if missing:
+            self._index_thread = threading.Thread(
+                target=self._index_images, args=(missing,), name="project-index", daemon=True
+            )
+            self._index_thread.start()
+
+    def _index_images(self, names: Iterable[str]):
+        # reads the files directly, images being created meanwhile are never opened
+        for name in names:
+            try:
+                meta, snapshot_count, time_snapshot = ProjectImage.read_summary(os.path.join(self._images_dir, name))
+            except (OSError, ValueError):
+                logging.warning(f"cannot index image \"{name}\"", exc_info=True)
+                continue
+            self._index.add(name, meta, snapshot_count, time_snapshot)
+
+    # ------------------------ Batch API -------------------------
+
+    def save_snapshots(
+            self,
+            names: Optional[Iterable[str]] = None,
+            description: str = "",
+            rehash: bool = False,
+            workers: Optional[int] = None,
+            processes: bool = False,
+            progress: Optional[ProgressCallback] = None,
+    ) -> List[BatchResult]:
+        """Snapshots the given images (all by default) in parallel."""
+        names = self.names if names is None else list(names)
+        return self._run_batch("save_snapshot", [(name, (description, rehash)) for name in names],
+                               workers, processes, progress)
+
+    def update_images(
+            self,
+            contents: Mapping[str, bytes],
+            workers: Optional[int] = None,
+            processes: bool = False,
+            progress: Optional[ProgressCallback] = None,
+    ) -> List[BatchResult]:
+        return self._run_batch("update", [(name, (content,)) for name, content in contents.items()],
+                               workers, processes, progress)
+
+    def create_images(
+            self,
+            contents: Mapping[str, Optional[bytes]],
+            workers: Optional[int] = None,
+            processes: bool = False,
+            progress: Optional[ProgressCallback] = None,
+    ) -> List[BatchResult]:
+        """Creates images named by the keys of ``contents``, with the value as initial content (or None)."""
+        with self._lock:
+            existing = set(contents) & self._names
+        if existing:
+            raise ValueError(f"images already exist: {sorted(existing)!r}")
+
+        return self._run_batch("create_image", [(name, (content,)) for name, content in contents.items()],
+                               workers, processes, progress)
+
+    def gc(
+            self,
+            min_age: float = MIN_AGE,
+            workers: Optional[int] = None,
+            progress: Optional[ProgressCallback] = None,
+    ) -> int:
+        """
+        Removes blobs no snapshot of any image uses, see ``Repository.gc``.
+
+        With a shared store every image refreshes its references first, and the
+        store is only pruned if all of them succeeded; references of images that
+        no longer exist are dropped.
+
+        :return: number of blobs removed
+        """
+        if self._store is None:
+            results = self._run_batch(_gc_image, [(name, (min_age,)) for name in self.names], workers, False, progress)
+            _raise_failures(results, "gc")
+            return sum(result.value for result in results)
+
+        results = self._run_batch(_refresh_refs, [(name, ()) for name in self.names], workers, False, progress)
+        _raise_failures(results, "refreshing references")
+
+        owners = set(self._store.owner_key(os.path.join(self._images_dir, name)) for name in self.names)
+        for owner in self._store.owner_keys() - owners:
+            self._store.release(owner)
+
+        removed = self._store.prune(min_age)
+        self._run_batch(_prune_cache, [(name, ()) for name in self.names], workers, False, None)
+        return removed
+
+    def fsck(
+            self,
+            workers: Optional[int] = None,
+            progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[str, FsckResult]:
+        """
+        Verifies the blobs of every image on one process pool, blobs shared by
+        several images are only hashed once.
+
+        :param progress: called with ``(checked, total)`` blobs
+        :return: result per image name
+        """
+        plans = self._run_batch(_fsck_plan, [(name, ()) for name in self.names], workers, False, None)
+        _raise_failures(plans, "fsck")
+
+        blobs = set()
+        for plan in plans:
+            store_path, present, _ = plan.value
+            blobs.update((store_path, file_id) for file_id in present)
+
+        corrupt = set(verify_blobs(sorted(blobs), workers, progress).corrupt)
+
+        return {
+            plan.name: FsckResult(len(plan.value[1]), sorted(corrupt.intersection(plan.value[1])), plan.value[2])
+            for plan in plans
+        }
+
+    def _run_batch(self, op, jobs, workers, processes, progress) -> List[BatchResult]:
+        results = run_batch(self, op, jobs, workers, processes, progress)
+
+        if processes:
+            # the work happened in other processes, drop our now stale copies
+            with self._lock:
+                for result in results:
+                    self._images.pop(result.name, None)
+                    if op == "create_image" and result.ok:
+                        self._names.add(result.name)
+
+        return results
+
+    def _remember(self, name: str, image: ProjectImage):
+        self._images[name] = image
+        self._images.move_to_end(name)
+        while len(self._images) > self._max_resident_images:
+            self._images.popitem(last=False)
+
+    def __contains__(self, name: str):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(sorted(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def names(self):
+        return sorted(self._names)
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def store(self) -> Optional[SharedBlobStore]:
+        """Shared blob store of all images, None unless enabled."""
+        return self._store
 
     @property
     def root_dir(self):
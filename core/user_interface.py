@@ -1,12 +1,63 @@
 import typing
 
+from PyQt5 import QtCore, QtWidgets
+
 if typing.TYPE_CHECKING:
     from mainwindow import MainWindow
 
 
+class _PlaceholderTab(QtWidgets.QWidget):
+    """Empty tab that calls ``on_first_show`` once it is actually on screen."""
+
+    def __init__(self, on_first_show: typing.Callable[[], None]):
+        super().__init__()
+        self._on_first_show: typing.Optional[typing.Callable[[], None]] = on_first_show
+
+    def showEvent(self, e):
+        super().showEvent(e)
+        if self._on_first_show is not None:
+            # not from within the event, activating replaces this very tab
+            QtCore.QTimer.singleShot(0, self._on_first_show)
+            self._on_first_show = None
+
+    @property
+    def pending(self) -> bool:
+        return self._on_first_show is not None
+
+
 class UserInterface:
     def __init__(self, window: 'MainWindow'):
         self._window = window
 
+        # tab title -> placeholder of an extension activated once its tab is shown
+        self._placeholders: typing.Dict[str, _PlaceholderTab] = {}
+
     def register_tab(self, name, widget):
-        self._window.tabs.addTab(widget, name)
+        placeholder = self._placeholders.pop(name, None)
+        if placeholder is None:
+            tabs = self._window.tabs
+            index = tabs.addTab(widget, name)
+            # a placeholder only became current by being added first, it must not be what the window opens on
+            current = tabs.currentWidget()
+            if isinstance(current, _PlaceholderTab) and current.pending and not current.isVisible():
+                tabs.setCurrentIndex(index)
+            return
+
+        # a lazily activated extension filling in its tab
+        tabs = self._window.tabs
+        index = tabs.indexOf(placeholder)
+        current = tabs.currentIndex() == index
+        tabs.removeTab(index)
+        tabs.insertTab(index, widget, name)
+        if current:
+            tabs.setCurrentIndex(index)
+        placeholder.deleteLater()
+
+    def register_placeholder_tab(self, name, on_first_show: typing.Callable[[], None]):
+        """
+        Adds an empty tab, ``on_first_show`` is called once the tab is on screen
+        and is expected to ``register_tab`` the real one under ``name``.
+        """
+        placeholder = _PlaceholderTab(on_first_show)
+        self._placeholders[name] = placeholder
+        self._window.tabs.addTab(placeholder, name)
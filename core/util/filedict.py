@@ -1,10 +1,18 @@
+import contextlib
 import os
-from typing import Union, Callable, Any
+import tempfile
+from typing import Union, Callable, Any, Optional
 
 import time
 import ujson
 
 _MISSING = object()
+_TMP_SUFFIX = ".tmp"
+
+
+def is_temp_file(basename: str) -> bool:
+    """Whether ``basename`` is a temp file of a ``FileDict`` write, which may vanish any moment."""
+    return basename.startswith(".") and basename.endswith(_TMP_SUFFIX)
 
 
 class field:  # noqa
@@ -40,33 +48,114 @@ class field:  # noqa
 
 
 class FileDict:
+    # seconds a loaded state is trusted by reads before the file is stat'ed again, 0 checks on every
+    # access; writes always check, they must never save an outdated dict over newer data
+    _MAX_AGE: float = 0.0
 
-    def __init__(self, fn: Union[str, os.PathLike]):
+    def __init__(self, fn: Union[str, os.PathLike], max_age: Optional[float] = None):
         self._fn = fn
-        self._last_access = None
+        self._max_age = self._MAX_AGE if max_age is None else max_age
+        self._mtime = None
+        self._last_check = None
+        self._batch_depth = 0
+        self._dirty = False
         self._data = dict()
+        self._listeners = []
 
         if not os.path.isfile(self._fn):
-            self.__dump()
+            self.__create()
+
+    def __write_tmp(self) -> str:
+        # unique per writer, concurrent writers of the same file never share a temp file
+        tmp_fd, tmp_fn = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._fn)),
+                                          prefix=f".{os.path.basename(self._fn)}.", suffix=_TMP_SUFFIX)
+        try:
+            with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
+                ujson.dump(self._data, f)
+        except BaseException:
+            os.unlink(tmp_fn)
+            raise
+        return tmp_fn
+
+    def __create(self):
+        # linked into place only if nobody else created the file meanwhile, an empty
+        # dict must never replace data another writer just saved
+        tmp_fn = self.__write_tmp()
+        try:
+            os.link(tmp_fn, self._fn)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_fn)
 
     def __dump(self):
-        with open(self._fn, "w", encoding="utf-8") as f:
-            ujson.dump(self._data, f)
-        self._last_access = time.time()
-
-    def __load(self):
-        if self._last_access is None or self._last_access < os.path.getmtime(self._fn):
-            with open(self._fn, 'r', encoding="utf-8") as f:
-                try:
-                    self._data = ujson.load(f)
-                except Exception as e:
-                    raise Exception(self._fn) from e
-            self._last_access = time.time()
+        # write a temp file and rename it over, a crash never leaves a truncated file
+        tmp_fn = self.__write_tmp()
+        try:
+            os.replace(tmp_fn, self._fn)
+        except BaseException:
+            os.unlink(tmp_fn)
+            raise
+
+        self._mtime = os.stat(self._fn).st_mtime_ns
+        self._last_check = time.monotonic()
+        self._dirty = False
+
+        for callback in self._listeners:
+            callback(dict(self._data))
+
+    def __load(self, fresh: bool = False):
+        if self._batch_depth:
+            if self._mtime is None:
+                self.__reload()
+            return self._data
+
+        now = time.monotonic()
+        if fresh or self._last_check is None or now - self._last_check >= self._max_age:
+            if self._mtime != os.stat(self._fn).st_mtime_ns:
+                self.__reload()
+            self._last_check = now
         return self._data
 
+    def __reload(self):
+        with open(self._fn, 'r', encoding="utf-8") as f:
+            try:
+                self._data = ujson.load(f)
+            except Exception as e:
+                raise Exception(self._fn) from e
+            self._mtime = os.fstat(f.fileno()).st_mtime_ns
+        self._last_check = time.monotonic()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Coalesces all assignments made inside the block into a single write."""
+        if not self._batch_depth:
+            self.__load(fresh=True)
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self.__dump()
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        """Calls ``callback`` with a copy of the data after every write."""
+        self._listeners.append(callback)
+
+    def to_dict(self) -> dict:
+        return dict(self.__load())
+
+    def invalidate(self):
+        """Forces the next access to check the file again."""
+        self._last_check = None
+
     def __setitem__(self, key, value):
-        self.__load().__setitem__(key, value)
-        self.__dump()
+        self.__load(fresh=True).__setitem__(key, value)
+        if self._batch_depth:
+            self._dirty = True
+        else:
+            self.__dump()
 
     def __getitem__(self, item):
         return self.__load()[item]
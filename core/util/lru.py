@@ -0,0 +1,85 @@
+import collections
+import threading
+from typing import Any, Callable, Hashable, Optional
+
+
+class ByteLRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values rather than their count."""
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, max_bytes: int, size_of: Callable[[Any], int] = len):
+        self._max_bytes = max_bytes
+        self._size_of = size_of
+        self._items: 'collections.OrderedDict[Hashable, tuple]' = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ---------------------- Public Methods ----------------------
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        size = self._size_of(value)
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+
+            # values larger than the whole cache are never kept
+            if size > self._max_bytes:
+                return
+
+            self._items[key] = (value, size)
+            self._bytes += size
+
+            while self._bytes > self._max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'items': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self._max_bytes,
+            }
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def __contains__(self, key: Hashable):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
@@ -0,0 +1,154 @@
+import atexit
+import collections
+import contextlib
+import functools
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import ujson
+
+TRACE_ENV = "KAIRYO_TRACE"
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_args', '_start')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tracer._record(self._name, self._start, time.perf_counter_ns(), self._args)
+        return False
+
+
+class Tracer:
+    """
+    Registry of named timing spans and counters.
+
+    Disabled, ``span`` returns a shared no-op context manager and ``count``
+    returns right away, so instrumented hot paths cost one attribute check.
+    Enabled, every span and counter change is kept as an event and ``dump``
+    writes them in the Chrome trace format (``chrome://tracing``, Perfetto)
+    with per-name totals under ``otherData``.
+    """
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+
+        self._origin = time.perf_counter_ns()
+        self._events: List[dict] = []
+        self._counters: Dict[str, float] = collections.defaultdict(float)
+        self._totals: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    # ---------------------- Public Methods ----------------------
+
+    def span(self, name: str, **args):
+        """
+        Times the enclosed block::
+
+            with tracer.span("vcs.save_snapshot", path=path):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def traced(self, name: Optional[str] = None):
+        """Decorator timing every call of a function, named after its qualified name by default."""
+        def decorator(func):
+            label = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, label, {}):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._counters[name] += value
+            self._events.append({
+                'name': name, 'ph': "C", 'ts': self._us(time.perf_counter_ns()), 'pid': os.getpid(),
+                'tid': threading.get_ident(), 'args': {'value': self._counters[name]},
+            })
+
+    def enable(self, dump_path: Optional[str] = None):
+        """:param dump_path: trace file written when the interpreter exits"""
+        self.enabled = True
+        if dump_path:
+            atexit.register(self.dump, dump_path)
+
+    def summary(self) -> Dict[str, Any]:
+        """:return: ``{'spans': {name: {count, total_ms, max_ms}}, 'counters': {name: value}}``"""
+        with self._lock:
+            return {
+                'spans': {
+                    name: {'count': count, 'total_ms': total / 1e6, 'max_ms': longest / 1e6}
+                    for name, (count, total, longest) in self._totals.items()
+                },
+                'counters': dict(self._counters),
+            }
+
+    def dump(self, path: str):
+        summary = self.summary()
+        with self._lock:
+            events = list(self._events)
+
+        with open(path, "w", encoding="utf-8") as f:
+            ujson.dump({'traceEvents': events, 'displayTimeUnit': "ms", 'otherData': summary}, f)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._counters.clear()
+            self._totals.clear()
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _us(self, ns: int) -> float:
+        return (ns - self._origin) / 1000
+
+    def _record(self, name: str, start: int, end: int, args: dict):
+        duration = end - start
+        event = {
+            'name': name, 'ph': "X", 'ts': self._us(start), 'dur': duration / 1000, 'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+
+        with self._lock:
+            self._events.append(event)
+
+            totals = self._totals.setdefault(name, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+
+
+# process-wide, ``KAIRYO_TRACE=<file>`` enables it and writes the trace on exit
+tracer = Tracer()
+if os.environ.get(TRACE_ENV):
+    tracer.enable(os.environ[TRACE_ENV])
@@ -0,0 +1,228 @@
+import hashlib
+import io
+import lzma
+import struct
+import zlib
+from typing import BinaryIO, Optional
+
+# Encoded blob record:
+#
+#   b"KBLB" | u8 codec | u8 depth | base sha256 digest | u64 raw size | payload
+#
+# depth == 0: payload is the whole blob compressed with ``codec``
+# depth > 0:  payload is a delta against ``base`` compressed with ``codec``,
+#             ``depth`` is the length of the delta chain down to a full blob
+
+RECORD_MAGIC = b"KBLB"
+RECORD_HEADER = struct.Struct(">4sBB32sQ")
+
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_LZMA = "lzma"
+
+CODECS = {
+    CODEC_NONE: 0,
+    CODEC_ZLIB: 1,
+    CODEC_LZMA: 2,
+}
+_CODEC_NAMES = {v: k for k, v in CODECS.items()}
+
+_DELTA_COPY = struct.Struct(">BQQ")
+_DELTA_INSERT = struct.Struct(">BQ")
+_OP_COPY = 0
+_OP_INSERT = 1
+
+DELTA_BLOCK_SIZE = 4096
+
+
+class _Identity:
+    @staticmethod
+    def compress(data):
+        return data
+
+    @staticmethod
+    def flush():
+        return b""
+
+    @staticmethod
+    def decompress(data, max_length=-1):
+        # never more than a chunk is passed in, it is returned whole
+        return data
+
+
+def compressor(codec: str):
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(6)
+    if codec == CODEC_LZMA:
+        return lzma.LZMACompressor()
+    if codec == CODEC_NONE:
+        return _Identity()
+    raise ValueError(f"unknown codec \"{codec}\"")
+
+
+def decompressor(codec: str):
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    if codec == CODEC_LZMA:
+        return lzma.LZMADecompressor()
+    if codec == CODEC_NONE:
+        return _Identity()
+    raise ValueError(f"unknown codec \"{codec}\"")
+
+
+def codec_name(codec_id: int) -> str:
+    try:
+        return _CODEC_NAMES[codec_id]
+    except KeyError as e:
+        raise ValueError(f"unknown codec id {codec_id}") from e
+
+
+def pack_header(codec: str, depth: int, base: Optional[str], raw_size: int) -> bytes:
+    base = bytes.fromhex(base) if base else bytes(32)
+    return RECORD_HEADER.pack(RECORD_MAGIC, CODECS[codec], depth, base, raw_size)
+
+
+def unpack_header(data: bytes):
+    magic, codec_id, depth, base, raw_size = RECORD_HEADER.unpack(data)
+    if magic != RECORD_MAGIC:
+        raise ValueError("not an encoded blob record")
+    return codec_name(codec_id), depth, (base.hex() if depth else None), raw_size
+
+
+class DecompressReader(io.RawIOBase):
+    """
+    Streams the decompressed payload of a record without holding it in memory,
+    at most ``chunk_size`` bytes of it are decompressed ahead of the reader.
+    """
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, f: BinaryIO, codec: str, chunk_size: int = 1024 * 1024):
+        super().__init__()
+        self._f = f
+        self._decompressor = decompressor(codec)
+        self._chunk_size = chunk_size
+        # decompressed data and how much of it was read, compressed data not decompressed yet
+        self._buffer = b""
+        self._offset = 0
+        self._input = b""
+        self._pos = 0
+        self._eof = False
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._offset == len(self._buffer) and not self._eof:
+            # lzma may still have output buffered without needing input, and ends with its stream
+            ended = getattr(self._decompressor, 'eof', False)
+            needs_input = getattr(self._decompressor, 'needs_input', True)
+            if not self._input and needs_input and not ended:
+                self._input = self._f.read(self._chunk_size)
+            if not self._input and (needs_input or ended):
+                self._eof = True
+                self._buffer = self._decompressor.flush() if hasattr(self._decompressor, 'flush') else b""
+                self._offset = 0
+                break
+
+            # zlib keeps what it didn't get to in unconsumed_tail, lzma internally
+            self._buffer = self._decompressor.decompress(self._input, self._chunk_size)
+            self._offset = 0
+            self._input = getattr(self._decompressor, 'unconsumed_tail', b"")
+
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = memoryview(self._buffer)[self._offset:self._offset + n]
+        self._offset += n
+        self._pos += n
+        return n
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def make_delta(target: BinaryIO, base: BinaryIO, limit: int, block_size: int = DELTA_BLOCK_SIZE) -> Optional[bytes]:
+    """
+    Block-aligned binary delta of ``target`` against ``base``.
+
+    Every ``block_size`` block of the target is either copied from an identical
+    block anywhere in the base or inserted literally. This catches in-place
+    edits and appended data (the common case for retouched layers) in
+    O(size / block_size) dictionary lookups.
+
+    :param limit: give up and return None once more than ``limit`` literal bytes are needed
+    """
+    blocks = {}
+    base_offset = 0
+    while True:
+        chunk = base.read(block_size)
+        if not chunk:
+            break
+        blocks.setdefault(hashlib.blake2b(chunk, digest_size=16).digest(), base_offset)
+        base_offset += len(chunk)
+
+    out = io.BytesIO()
+    inserted = 0
+    copy_offset = copy_length = 0
+    pending = bytearray()
+
+    def flush_copy():
+        if copy_length:
+            out.write(_DELTA_COPY.pack(_OP_COPY, copy_offset, copy_length))
+
+    def flush_insert():
+        if pending:
+            out.write(_DELTA_INSERT.pack(_OP_INSERT, len(pending)))
+            out.write(pending)
+            pending.clear()
+
+    while True:
+        chunk = target.read(block_size)
+        if not chunk:
+            break
+
+        offset = blocks.get(hashlib.blake2b(chunk, digest_size=16).digest())
+        if offset is None:
+            flush_copy()
+            copy_length = 0
+
+            inserted += len(chunk)
+            if inserted > limit:
+                return None
+            pending += chunk
+        elif copy_length and copy_offset + copy_length == offset:
+            copy_length += len(chunk)
+        else:
+            flush_insert()
+            flush_copy()
+            copy_offset, copy_length = offset, len(chunk)
+
+    flush_insert()
+    flush_copy()
+
+    return out.getvalue()
+
+
+def apply_delta(delta: bytes, base: BinaryIO, out: BinaryIO):
+    view = memoryview(delta)
+    pos = 0
+    while pos < len(view):
+        op = view[pos]
+        if op == _OP_COPY:
+            _, offset, length = _DELTA_COPY.unpack_from(view, pos)
+            pos += _DELTA_COPY.size
+            base.seek(offset)
+            out.write(base.read(length))
+        elif op == _OP_INSERT:
+            _, length = _DELTA_INSERT.unpack_from(view, pos)
+            pos += _DELTA_INSERT.size
+            out.write(view[pos:pos + length])
+            pos += length
+        else:
+            raise ValueError(f"corrupt delta (unknown op {op})")
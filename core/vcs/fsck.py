@@ -0,0 +1,88 @@
+import concurrent.futures
+import hashlib
+import os
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .store import BlobStore, read_big
+
+_CHUNK_SIZE = 1024 * 1024
+# blobs per task, enough to amortize the round trip to the worker process
+_BATCH_SIZE = 64
+
+# stores opened by this (worker) process, by path
+_stores: Dict[str, BlobStore] = {}
+
+
+class FsckResult(NamedTuple):
+    checked: int
+    # blobs whose content doesn't hash to their id, or that can't be decoded (e.g. a missing delta base)
+    corrupt: List[str]
+    # blobs referenced by a snapshot but not in the store
+    missing: List[str]
+
+    @property
+    def ok(self):
+        return not self.corrupt and not self.missing
+
+    def merge(self, other: 'FsckResult') -> 'FsckResult':
+        return FsckResult(
+            self.checked + other.checked, sorted(set(self.corrupt + other.corrupt)),
+            sorted(set(self.missing + other.missing)),
+        )
+
+
+def _verify(store_path: str, file_ids: List[str]) -> List[str]:
+    store = _stores.get(store_path)
+    if store is None:
+        store = _stores[store_path] = BlobStore(store_path)
+
+    corrupt = []
+    for file_id in file_ids:
+        file_hash = hashlib.sha256()
+        try:
+            with store.open(file_id) as f:
+                for chunk in read_big(f, _CHUNK_SIZE):
+                    file_hash.update(chunk)
+        except Exception:  # noqa
+            # anything from missing delta bases to zlib / lzma errors on damaged streams
+            corrupt.append(file_id)
+            continue
+
+        if file_hash.hexdigest() != file_id:
+            corrupt.append(file_id)
+
+    return corrupt
+
+
+def verify_blobs(
+        blobs: Iterable[Tuple[str, str]],
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+) -> FsckResult:
+    """
+    Re-hashes the decoded content of ``(store path, blob id)`` pairs on a process pool.
+
+    :param progress: called with ``(checked, total)`` from the calling thread
+    """
+    by_store: Dict[str, List[str]] = {}
+    for store_path, file_id in blobs:
+        by_store.setdefault(store_path, []).append(file_id)
+
+    total = sum(len(file_ids) for file_ids in by_store.values())
+    checked = 0
+    corrupt = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {}
+        for store_path, file_ids in by_store.items():
+            for i in range(0, len(file_ids), _BATCH_SIZE):
+                batch = file_ids[i:i + _BATCH_SIZE]
+                futures[executor.submit(_verify, store_path, batch)] = len(batch)
+
+        for future in concurrent.futures.as_completed(futures):
+            corrupt.extend(future.result())
+            checked += futures[future]
+            if progress is not None:
+                progress(checked, total)
+
+    return FsckResult(checked, sorted(corrupt), [])
@@ -0,0 +1,109 @@
+import os
+from typing import Dict, Optional, Iterable
+
+import ujson
+
+
+class StatIndex:
+    """
+    Persistent ``path -> (size, mtime_ns, inode, blob id)`` cache.
+
+    Lets ``Repository.save_snapshot`` reuse the blob id of a file whose stat
+    signature has not changed instead of reading and hashing it again.
+    """
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, fn: str):
+        self._fn = fn
+        self._entries: Dict[str, list] = {}
+        self._stamp = 0
+        self._dirty = False
+
+        self._load()
+
+    # ---------------------- Public Methods ----------------------
+
+    def lookup(self, fn: str, st: os.stat_result) -> Optional[str]:
+        entry = self._entries.get(fn)
+        if entry is None:
+            return None
+
+        size, mtime_ns, inode, file_id = entry
+        if (size, mtime_ns, inode) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+
+        # "racily clean" entry: the file may have been modified again within the
+        # same timestamp granularity as the index write, so it can't be trusted
+        if mtime_ns >= self._stamp:
+            return None
+
+        return file_id
+
+    def file_ids(self) -> set:
+        """Blob ids of all indexed files, trusted or not."""
+        return set(entry[3] for entry in self._entries.values())
+
+    def update(self, fn: str, st: os.stat_result, file_id: str):
+        entry = [st.st_size, st.st_mtime_ns, st.st_ino, file_id]
+        if self._entries.get(fn) != entry:
+            self._entries[fn] = entry
+            self._dirty = True
+
+    def retain(self, paths: Iterable[str]):
+        paths = set(paths)
+        for fn in list(self._entries):
+            if fn not in paths:
+                del self._entries[fn]
+                self._dirty = True
+
+    def clear(self):
+        if self._entries:
+            self._entries.clear()
+            self._dirty = True
+
+    def refresh(self):
+        """Reloads the index if another ``StatIndex`` saved it since, unsaved changes win."""
+        if self._dirty:
+            return
+        try:
+            stamp = os.stat(self._fn).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if stamp != self._stamp:
+            self._load()
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        tmp_fn = f"{self._fn}.tmp"
+        with open(tmp_fn, "w", encoding="utf-8") as f:
+            ujson.dump(self._entries, f)
+        os.replace(tmp_fn, self._fn)
+
+        self._stamp = os.stat(self._fn).st_mtime_ns
+        self._dirty = False
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _load(self):
+        try:
+            with open(self._fn, "r", encoding="utf-8") as f:
+                self._entries = ujson.load(f)
+            self._stamp = os.stat(self._fn).st_mtime_ns
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+            self._stamp = 0
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def path(self):
+        return self._fn
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,252 @@
+import bisect
+import collections
+import itertools
+import logging
+import os
+import pickle
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import ujson
+
+_RECORD_HEADER = struct.Struct(">I")
+
+
+class SnapshotLog:
+    """
+    Append-only snapshot storage of a repository.
+
+    ``snapshots.log`` holds length-prefixed JSON records with the full snapshot
+    (including its tree), ``snapshots.idx`` holds one JSON line per snapshot
+    with only its header (hash, parent, description, timestamp) and the
+    record's position in the log. Opening reads only the index; trees are read
+    from the log on demand.
+
+    Headers are also kept ordered by timestamp and linked to their children,
+    so history pages and ancestor walks never touch the log or sort.
+    """
+
+    _LOG_FILENAME = "snapshots.log"
+    _INDEX_FILENAME = "snapshots.idx"
+    _LEGACY_DIRNAME = "snapshots"
+    # root is the snapshot's tree hash (see tree.py), None for snapshots saved before it existed
+    _HEADER_KEYS = ('hash', 'parent', 'description', 'timestamp', 'root')
+    _CACHE_SIZE = 16
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, path: str):
+        self._path = os.path.abspath(path)
+        self._log_fn = os.path.join(self._path, self._LOG_FILENAME)
+        self._index_fn = os.path.join(self._path, self._INDEX_FILENAME)
+
+        self._headers: Dict[str, dict] = {}
+        # hashes oldest first, with their timestamps alongside for bisecting
+        self._order: List[str] = []
+        self._timestamps: List[float] = []
+        self._children: Dict[str, List[str]] = collections.defaultdict(list)
+        self._cache: 'collections.OrderedDict[str, dict]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # bytes of the index read so far
+        self._index_size = 0
+        # headers read from the index whose records were not in the log yet
+        self._pending: List[dict] = []
+
+        self._load_index()
+        self._migrate_legacy()
+
+    # ---------------------- Public Methods ----------------------
+
+    def append(self, snapshot_data: dict):
+        data = ujson.dumps(snapshot_data).encode("utf-8")
+
+        with open(self._log_fn, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(_RECORD_HEADER.pack(len(data)))
+            f.write(data)
+
+        header = {k: snapshot_data.get(k) for k in self._HEADER_KEYS}
+        header['offset'] = offset
+        header['length'] = len(data)
+
+        # the index line is written last, a crash in between leaves an unreferenced record
+        with open(self._index_fn, 'a', encoding="utf-8") as f:
+            f.write(ujson.dumps(header) + "\n")
+
+        self._add(header)
+        self._remember(header['hash'], snapshot_data)
+
+    @classmethod
+    def read_summary(cls, path: str) -> Tuple[int, Optional[float]]:
+        """
+        Snapshot count and newest timestamp of the log in ``path``, read straight
+        from its index (or legacy snapshots) without opening or migrating it.
+        """
+        timestamps = {}
+
+        try:
+            with open(os.path.join(path, cls._INDEX_FILENAME), 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        header = ujson.loads(line)
+                    except ValueError:
+                        continue
+                    timestamps[header['hash']] = header['timestamp']
+        except FileNotFoundError:
+            pass
+
+        legacy_path = os.path.join(path, cls._LEGACY_DIRNAME)
+        if os.path.isdir(legacy_path):
+            for basename in os.listdir(legacy_path):
+                with open(os.path.join(legacy_path, basename), 'rb') as f:
+                    snapshot_data = pickle.load(f)
+                timestamps[snapshot_data['hash']] = snapshot_data['timestamp']
+
+        return len(timestamps), max(timestamps.values(), default=None)
+
+    def refresh(self):
+        """Picks up snapshots appended through another ``SnapshotLog`` of the same repository."""
+        self._load_index()
+
+    def get(self, snapshot_hash: str) -> dict:
+        with self._lock:
+            snapshot_data = self._cache.get(snapshot_hash)
+        if snapshot_data is None:
+            snapshot_data = self._read(self._headers[snapshot_hash])
+
+        self._remember(snapshot_hash, snapshot_data)
+        return snapshot_data
+
+    def header(self, snapshot_hash: str) -> dict:
+        return self._headers[snapshot_hash]
+
+    def iter_headers(self, newest_first: bool = True, offset: int = 0) -> Iterator[dict]:
+        """Headers in timestamp order, starting ``offset`` snapshots in."""
+        order = reversed(self._order) if newest_first else iter(self._order)
+        for snapshot_hash in itertools.islice(order, offset, None):
+            yield self._headers[snapshot_hash]
+
+    def page(self, limit: Optional[int] = None, offset: int = 0, newest_first: bool = True) -> List[dict]:
+        return list(itertools.islice(self.iter_headers(newest_first, offset), limit))
+
+    def children(self, snapshot_hash: str) -> List[dict]:
+        return [self._headers[child] for child in self._children.get(snapshot_hash, ())]
+
+    def ancestors(self, snapshot_hash: str, include_self: bool = False) -> Iterator[dict]:
+        """Walks the parent links up to the root snapshot."""
+        header = self._headers[snapshot_hash]
+        if not include_self:
+            header = self._headers.get(header['parent'])
+
+        while header is not None:
+            yield header
+            header = self._headers.get(header['parent'])
+
+    def latest(self) -> Optional[dict]:
+        return self._headers[self._order[-1]] if self._order else None
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _read(self, header: dict) -> dict:
+        with open(self._log_fn, 'rb') as f:
+            f.seek(header['offset'])
+            length, = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+            return ujson.loads(f.read(length))
+
+    def _add(self, header: dict):
+        snapshot_hash = header['hash']
+        if snapshot_hash in self._headers:
+            return
+
+        self._headers[snapshot_hash] = header
+
+        # appends are nearly always the newest, insort is then a plain append
+        i = bisect.bisect_right(self._timestamps, header['timestamp'])
+        self._timestamps.insert(i, header['timestamp'])
+        self._order.insert(i, snapshot_hash)
+
+        if header['parent'] is not None:
+            self._children[header['parent']].append(snapshot_hash)
+
+    def _remember(self, snapshot_hash: str, snapshot_data: dict):
+        # trees are read from reader threads (e.g. the comparer's loaders) too
+        with self._lock:
+            self._cache[snapshot_hash] = snapshot_data
+            self._cache.move_to_end(snapshot_hash)
+            while len(self._cache) > self._CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _load_index(self):
+        if not os.path.isfile(self._index_fn):
+            return
+
+        with open(self._index_fn, 'rb') as f:
+            f.seek(self._index_size)
+            data = f.read()
+
+        # writers append the record before its index line, so once the index is read,
+        # the log holds the records of every line in it
+        log_size = os.path.getsize(self._log_fn) if os.path.isfile(self._log_fn) else 0
+
+        # a trailing line without newline is still being written, it is read on the next refresh
+        data = data[:data.rfind(b"\n") + 1]
+        self._index_size += len(data)
+
+        headers, retried = self._pending, len(self._pending)
+        self._pending = []
+        for line in data.splitlines():
+            try:
+                headers.append(ujson.loads(line))
+            except ValueError:
+                # torn line left by a crashed writer
+                logging.warning(f"skipping corrupt entry in {self._index_fn}")
+
+        for i, header in enumerate(headers):
+            if header['offset'] + _RECORD_HEADER.size + header['length'] > log_size:
+                # kept and retried on every refresh instead of dropped for good
+                if i >= retried:
+                    logging.warning(f"snapshot '{header['hash']}' is missing from {self._log_fn}")
+                self._pending.append(header)
+                continue
+
+            self._add(header)
+
+    def _migrate_legacy(self):
+        # older repositories keep one pickle per snapshot in .vcs/snapshots
+        legacy_path = os.path.join(self._path, self._LEGACY_DIRNAME)
+        if not os.path.isdir(legacy_path):
+            return
+
+        legacy = []
+        for basename in os.listdir(legacy_path):
+            with open(os.path.join(legacy_path, basename), 'rb') as f:
+                legacy.append(pickle.load(f))
+
+        for snapshot_data in sorted(legacy, key=lambda x: x['timestamp']):
+            if snapshot_data['hash'] not in self._headers:
+                self.append(snapshot_data)
+
+        for basename in os.listdir(legacy_path):
+            os.unlink(os.path.join(legacy_path, basename))
+        os.rmdir(legacy_path)
+
+        if legacy:
+            logging.info(f"migrated {len(legacy)} snapshots to {self._log_fn}")
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def __contains__(self, snapshot_hash: str):
+        return snapshot_hash in self._headers
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._headers.values())
+
+    def __len__(self):
+        return len(self._headers)
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def headers(self) -> Dict[str, dict]:
+        return self._headers
@@ -0,0 +1,117 @@
+"""
+Measures what blob compression / delta encoding would save on a real project.
+
+Replays the history of every image repository into temporary stores, one per
+storage configuration, and reports stored bytes against the time it takes to
+read every version back::
+
+    python -m core.vcs.measure path/to/project --compression none zlib lzma --delta
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Iterable, List, Tuple
+
+import ujson
+
+from .codec import CODECS, CODEC_NONE
+from .store import BlobStore, read_big
+from .vcs import Repository
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for basename in files:
+            total += os.path.getsize(os.path.join(root, basename))
+    return total
+
+
+def measure_repository(repo: Repository, configurations: Iterable[Tuple[str, bool]]) -> List[dict]:
+    history = [repo.get_snapshot(header['hash']) for header in repo.iter_history(newest_first=False)]
+    results = []
+
+    for compression, delta in configurations:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = BlobStore(tmp, compression, delta)
+            trees = {}
+            raw_bytes = 0
+
+            started = time.perf_counter()
+            for snapshot in history:
+                parent_tree = trees.get(snapshot['parent'], {})
+                for fn, file_id in snapshot['tree'].items():
+                    if store.contains(file_id):
+                        continue
+                    with repo.store.open(file_id) as f:
+                        store.ingest_stream(f, parent_tree.get(fn))
+                    raw_bytes += store.info(file_id)['raw_size']
+                trees[snapshot['hash']] = snapshot['tree']
+            write_seconds = time.perf_counter() - started
+
+            file_ids = set(file_id for snapshot in history for file_id in snapshot['tree'].values())
+
+            started = time.perf_counter()
+            for file_id in file_ids:
+                with store.open(file_id) as f:
+                    for _ in read_big(f, 1024 * 1024):
+                        pass
+            read_seconds = time.perf_counter() - started
+
+            stored_bytes = _dir_size(tmp)
+            store.close()
+
+        results.append({
+            'compression': compression,
+            'delta': delta,
+            'blobs': len(file_ids),
+            'raw_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'write_seconds': write_seconds,
+            'read_seconds': read_seconds,
+        })
+
+    return results
+
+
+def measure_project(path: str, configurations: Iterable[Tuple[str, bool]]) -> List[dict]:
+    configurations = list(configurations)
+    totals = [
+        {'compression': c, 'delta': d, 'blobs': 0, 'raw_bytes': 0, 'stored_bytes': 0,
+         'write_seconds': 0.0, 'read_seconds': 0.0}
+        for c, d in configurations
+    ]
+
+    images_dir = os.path.join(path, "images")
+    for name in sorted(os.listdir(images_dir)):
+        repo = Repository(os.path.join(images_dir, name))
+        for total, result in zip(totals, measure_repository(repo, configurations)):
+            for key in ('blobs', 'raw_bytes', 'stored_bytes', 'write_seconds', 'read_seconds'):
+                total[key] += result[key]
+        repo.store.close()
+
+    for total in totals:
+        total['saved_ratio'] = 1 - total['stored_bytes'] / total['raw_bytes'] if total['raw_bytes'] else 0.0
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project")
+    parser.add_argument("--compression", nargs="+", choices=list(CODECS), default=list(CODECS))
+    parser.add_argument("--delta", action="store_true", help="also measure every codec with delta encoding")
+    args = parser.parse_args()
+
+    configurations = [(c, False) for c in args.compression]
+    if args.delta:
+        configurations += [(c, True) for c in args.compression]
+    if (CODEC_NONE, False) not in configurations:
+        configurations.insert(0, (CODEC_NONE, False))
+
+    print(ujson.dumps(measure_project(args.project, configurations), indent=2))
+
+
+if __name__ == '__main__':
+    main()
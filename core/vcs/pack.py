@@ -0,0 +1,235 @@
+import io
+import mmap
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+# Pack layout:
+#
+#   <name>.pack   b"KPCK" | u32 version | blob data ...
+#   <name>.idx    b"KIDX" | u32 version | u32 count | count * (sha256 digest, u64 offset, u64 length, u8 flags)
+#
+# Index entries are sorted by digest and have a fixed width, so a lookup is a
+# binary search straight over the memory-mapped index file. Version 1 indexes
+# have no flags byte, all of their blobs are stored raw.
+
+PACK_MAGIC = b"KPCK"
+INDEX_MAGIC = b"KIDX"
+PACK_VERSION = 2
+
+FLAG_RECORD = 0x01  # blob data is an encoded record (see codec.py), not the raw content
+
+_PACK_HEADER = struct.Struct(">4sI")
+_INDEX_HEADER = struct.Struct(">4sII")
+_INDEX_ENTRIES = {
+    1: struct.Struct(">32sQQ"),
+    2: struct.Struct(">32sQQB"),
+}
+_DIGEST_SIZE = 32
+
+
+class BlobView(io.RawIOBase):
+    """Read-only file object over a memoryview, used to read packed blobs without copying the pack."""
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, buffer: memoryview):
+        super().__init__()
+        self._buffer = buffer
+        self._pos = 0
+
+    # ---------------------- Public Methods ----------------------
+
+    def getbuffer(self) -> memoryview:
+        return self._buffer
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._buffer[self._pos:self._pos + len(b)]
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._buffer) - self._pos
+        data = self._buffer[self._pos:self._pos + size].tobytes()
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._buffer) + offset
+        else:
+            raise ValueError(f"invalid whence ({whence!r})")
+
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+
+        self._pos = pos
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+
+class Pack:
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, path: str):
+        """
+        :param path: pack path without extension
+        """
+        self._path = path
+
+        with open(self.index_path, 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._count = _INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version not in _INDEX_ENTRIES:
+            self._index.close()
+            raise ValueError(f"{self.index_path} is not a valid pack index")
+
+        self._entry = _INDEX_ENTRIES[version]
+
+        self._data: Optional[mmap.mmap] = None
+
+    # ---------------------- Public Methods ----------------------
+
+    def find(self, file_id: str) -> Optional[Tuple[int, int, int]]:
+        """
+        :return: ``(offset, length, flags)`` of the blob or None
+        """
+        digest = bytes.fromhex(file_id)
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = _INDEX_HEADER.size + mid * self._entry.size
+            key = self._index[pos:pos + _DIGEST_SIZE]
+            if key < digest:
+                lo = mid + 1
+            elif key > digest:
+                hi = mid
+            else:
+                _, offset, length, *flags = self._entry.unpack_from(self._index, pos)
+                return offset, length, (flags[0] if flags else 0)
+
+        return None
+
+    def open(self, file_id: str) -> Optional[Tuple[BlobView, int]]:
+        """
+        :return: ``(view, flags)`` of the stored blob data or None
+        """
+        location = self.find(file_id)
+        if location is None:
+            return None
+
+        offset, length, flags = location
+        return BlobView(memoryview(self._get_data())[offset:offset + length]), flags
+
+    def close(self):
+        for m in (self._index, self._data):
+            if m is None:
+                continue
+            try:
+                m.close()
+            except BufferError:
+                # a BlobView still references the map, it is released together with the last view
+                pass
+        self._data = None
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _get_data(self) -> mmap.mmap:
+        if self._data is None:
+            with open(self.pack_path, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            pos = _INDEX_HEADER.size + i * self._entry.size
+            yield self._index[pos:pos + _DIGEST_SIZE].hex()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, file_id: str):
+        return self.find(file_id) is not None
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def index_path(self):
+        return f"{self._path}.idx"
+
+    @property
+    def pack_path(self):
+        return f"{self._path}.pack"
+
+
+def write_pack(path: str, blobs: Iterable[Tuple[str, BinaryIO, int]], chunk_size: int = 1024 * 1024):
+    """
+    Writes ``(file_id, stored data, flags)`` triples into ``<path>.pack`` / ``<path>.idx``.
+
+    The pack is written first and the index is renamed into place last, so a
+    crashed repack never leaves a visible pack without a complete index.
+    """
+    entries = []
+
+    tmp_pack = f"{path}.pack.tmp"
+    tmp_index = f"{path}.idx.tmp"
+
+    try:
+        with open(tmp_pack, 'wb') as f_out:
+            f_out.write(_PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION))
+
+            for file_id, f_in, flags in blobs:
+                offset = f_out.tell()
+                with f_in:
+                    while True:
+                        chunk = f_in.read(chunk_size)
+                        if not chunk:
+                            break
+                        f_out.write(chunk)
+                entries.append((bytes.fromhex(file_id), offset, f_out.tell() - offset, flags))
+
+        entries.sort()
+
+        with open(tmp_index, 'wb') as f_out:
+            f_out.write(_INDEX_HEADER.pack(INDEX_MAGIC, PACK_VERSION, len(entries)))
+            for entry in entries:
+                f_out.write(_INDEX_ENTRIES[PACK_VERSION].pack(*entry))
+
+        os.replace(tmp_pack, f"{path}.pack")
+        os.replace(tmp_index, f"{path}.idx")
+    finally:
+        for fn in (tmp_pack, tmp_index):
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+    return len(entries)
@@ -0,0 +1,46 @@
+from PyQt5 import QtCore
+
+from .tasks import Cancelled, Task
+
+
+class TaskWatcher(QtCore.QObject):
+    """
+    Forwards progress and the outcome of a background ``Task`` as Qt signals.
+
+    Signals are emitted from the worker thread, receivers living on the GUI
+    thread get them queued::
+
+        watcher = TaskWatcher(self)
+        watcher.progress.connect(self._on_progress)
+        watcher.watch(image.save_snapshot_async(description, progress=watcher.report))
+    """
+
+    # files done, files total, path of the file just processed
+    progress = QtCore.pyqtSignal(int, int, str)
+    # result of the task
+    finished = QtCore.pyqtSignal(object)
+    # exception raised by the task
+    failed = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+
+    # ---------------------- Public Methods ----------------------
+
+    def report(self, done: int, total: int, path: str):
+        """Progress callback to pass to the ``*_async`` methods."""
+        self.progress.emit(done, total, path)
+
+    def watch(self, task: Task) -> Task:
+        task.add_done_callback(self._on_done)
+        return task
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _on_done(self, task: Task):
+        try:
+            result = task.result()
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:  # noqa
+            self.failed.emit(e)
+        else:
+            self.finished.emit(result)
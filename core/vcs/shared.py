@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, Optional, Set
+
+from core.util.filedict import NamedFileDict, field
+from . import codec
+from .store import MIN_AGE, BlobStore
+
+
+class SharedStoreMeta(NamedFileDict):
+    _MAX_AGE = 1.0
+
+    compression: str = field(default=codec.CODEC_NONE)
+    delta: bool = field(default=False)
+
+
+class SharedBlobStore(BlobStore):
+    """
+    Blob store used by several repositories at once (e.g. all images of a project).
+
+    Every repository registers the blobs its snapshots use under an owner key
+    in ``refs.sqlite``; ``prune`` only drops blobs no owner references, neither
+    directly nor as a delta base. The storage configuration is shared as well
+    and kept in ``store.json``.
+    """
+
+    _SCHEMA_VERSION = 1
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.meta = SharedStoreMeta(os.path.join(path, "store.json"))
+
+        super().__init__(path, self.meta.compression, self.meta.delta)
+
+        # the store's own _lock orders refs against ingest / prune, this one guards the connection
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "refs.sqlite"), timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+
+        with self._db_lock:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != self._SCHEMA_VERSION:
+                self._db.executescript(f"""
+                    CREATE TABLE IF NOT EXISTS refs (
+                        blob TEXT NOT NULL,
+                        owner TEXT NOT NULL,
+                        PRIMARY KEY (blob, owner)
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS refs_owner ON refs (owner);
+                    PRAGMA user_version = {self._SCHEMA_VERSION};
+                """)
+
+    # ---------------------- Public Methods ----------------------
+
+    def configure(self, compression: str = codec.CODEC_NONE, delta: bool = False):
+        super().configure(compression, delta)
+        if (self.meta.compression, self.meta.delta) != (compression, delta):
+            with self.meta.batch():
+                self.meta.compression = compression
+                self.meta.delta = delta
+
+    def owner_key(self, path: str) -> str:
+        """Owner key of a repository, stable as long as it keeps its place relative to the store."""
+        return os.path.relpath(os.path.abspath(path), self.path)
+
+    def add_refs(self, owner: str, file_ids: Iterable[str]):
+        with self._lock:
+            self._register(owner, file_ids)
+
+    def set_refs(self, owner: str, file_ids: Iterable[str]):
+        """Replaces everything ``owner`` references."""
+        rows = [(file_id, owner) for file_id in set(file_ids)]
+        with self._lock, self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM refs WHERE owner = ?", [owner])
+                self._db.executemany("INSERT INTO refs (blob, owner) VALUES (?, ?)", rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def release(self, owner: str):
+        """Drops every reference of ``owner``, e.g. when its repository is deleted."""
+        with self._db_lock:
+            self._db.execute("DELETE FROM refs WHERE owner = ?", [owner])
+
+    def owner_keys(self) -> Set[str]:
+        with self._db_lock:
+            return set(row[0] for row in self._db.execute("SELECT DISTINCT owner FROM refs"))
+
+    def owners(self, file_id: str) -> Set[str]:
+        with self._db_lock:
+            return set(row[0] for row in self._db.execute("SELECT owner FROM refs WHERE blob = ?", [file_id]))
+
+    def referenced(self) -> Set[str]:
+        """Referenced blobs and, transitively, the delta bases they need."""
+        with self._db_lock:
+            referenced = [row[0] for row in self._db.execute("SELECT DISTINCT blob FROM refs")]
+        return self.with_bases(referenced)
+
+    def prune(self, min_age: float = MIN_AGE) -> int:
+        """
+        Removes blobs nothing references.
+
+        :param min_age: seconds a loose blob is kept regardless, so blobs ingested
+            by a snapshot that is still being saved elsewhere survive
+        :return: number of blobs removed
+        """
+        # blobs are referenced as they are stored, under the same lock
+        with self._lock:
+            with self._db_lock:
+                referenced = [row[0] for row in self._db.execute("SELECT DISTINCT blob FROM refs")]
+            return self.remove_unreachable(referenced, min_age)
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _register(self, owner: Optional[str], file_ids: Iterable[str]):
+        if owner is None:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO refs (blob, owner) VALUES (?, ?)", [(file_id, owner) for file_id in file_ids]
+            )
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def close(self):
+        super().close()
+        with self._db_lock:
+            self._db.close()
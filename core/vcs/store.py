@@ -0,0 +1,662 @@
+import glob
+import hashlib
+import io
+import logging
+import math
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from . import codec
+from .pack import Pack, write_pack, FLAG_RECORD
+
+# seconds unreferenced blobs are kept by default, and temporary files always, so a
+# garbage collection never removes what a concurrent ingest is still writing
+MIN_AGE = 60 * 60
+
+
+def read_big(f: BinaryIO, chunk_size=4096):
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        yield data
+
+
+def map_file(f: BinaryIO) -> memoryview:
+    """Read-only memoryview of a whole open file, mapped rather than read."""
+    if not os.fstat(f.fileno()).st_size:
+        # empty files can't be mapped
+        return memoryview(b"")
+    return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class BlobStore:
+    """
+    Content-addressed blob storage of a repository.
+
+    New blobs are written loose into ``blobs/<sha256>``; ``repack`` moves them
+    into append-only packs under ``packs/``. Both are readable at all times.
+
+    With a ``compression`` codec or ``delta`` enabled, blobs that shrink are
+    stored as encoded records (``blobs/<sha256>.blob``, see codec.py) instead
+    of raw files. ``open`` always returns the decoded content.
+    """
+
+    _BLOBS_DIR = "blobs"
+    _PACKS_DIR = "packs"
+    _TMP_PREFIX = ".tmp-"
+    _RECORD_SUFFIX = ".blob"
+    _CHUNK_SIZE = 1024 * 1024
+    _MAX_DELTA_DEPTH = 16
+    _FICLONE = 0x40049409
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, path: str, compression: str = codec.CODEC_NONE, delta: bool = False):
+        self._path = os.path.abspath(path)
+        self._compression = codec.CODEC_NONE
+        self._delta = False
+
+        self.configure(compression, delta)
+
+        self._blobs_path = os.path.join(self._path, self._BLOBS_DIR)
+        self._packs_path = os.path.join(self._path, self._PACKS_DIR)
+
+        os.makedirs(self._blobs_path, exist_ok=True)
+        os.makedirs(self._packs_path, exist_ok=True)
+
+        self._packs: Dict[str, Pack] = {}
+        # mtime of packs/ at the last scan, other stores on the same directory repack and gc too
+        self._packs_mtime: Optional[int] = None
+        # held while blobs are put into place or removed and packs are swapped, so
+        # repack / gc never miss a blob that is being ingested by another thread
+        self._lock = threading.RLock()
+        self._load_packs()
+
+    # ---------------------- Public Methods ----------------------
+
+    def configure(self, compression: str = codec.CODEC_NONE, delta: bool = False):
+        if compression not in codec.CODECS:
+            raise ValueError(f"unknown compression \"{compression}\"")
+
+        self._compression = compression
+        self._delta = delta
+
+    def contains(self, file_id: str) -> bool:
+        if (
+            self._find_pack(file_id) is not None
+            or os.path.isfile(self.loose_path(file_id))
+            or os.path.isfile(self._record_path(file_id))
+        ):
+            return True
+
+        # possibly packed by another store since, costs a stat of packs/ otherwise
+        with self._lock:
+            return self._load_packs() and self._find_pack(file_id) is not None
+
+    def ingest(self, fn: str, base: Optional[str] = None, owner: Optional[str] = None) -> str:
+        """
+        :param base: blob id of the previous version of the file, used as a delta base
+        :param owner: registered as a user of the blob together with storing it,
+            see ``SharedBlobStore``. Plain stores ignore it.
+        """
+        with open(fn, 'rb') as f:
+            return self.ingest_stream(f, base, owner)
+
+    def ingest_stream(self, f_in: BinaryIO, base: Optional[str] = None, owner: Optional[str] = None) -> str:
+        # hash the file and copy it into a temporary blob in a single streaming
+        # pass, so peak memory is bounded by the chunk size
+        file_hash = hashlib.sha256()
+        tmp_fd, tmp_fn = tempfile.mkstemp(dir=self._blobs_path, prefix=self._TMP_PREFIX)
+        record_fn = None
+
+        try:
+            with os.fdopen(tmp_fd, 'wb') as f_out:
+                for chunk in read_big(f_in, self._CHUNK_SIZE):
+                    file_hash.update(chunk)
+                    f_out.write(chunk)
+
+            file_id = file_hash.hexdigest()
+
+            with self._lock:
+                if self.contains(file_id):
+                    self._register(owner, [file_id])
+                    os.unlink(tmp_fn)
+                    return file_id
+
+            record_fn = self._encode(tmp_fn, base)
+
+            with self._lock:
+                if self.contains(file_id):
+                    # stored by someone else while encoding
+                    os.unlink(tmp_fn)
+                    if record_fn is not None:
+                        os.unlink(record_fn)
+                elif record_fn is None:
+                    os.replace(tmp_fn, self.loose_path(file_id))
+                else:
+                    os.replace(record_fn, self._record_path(file_id))
+                    os.unlink(tmp_fn)
+                self._register(owner, [file_id])
+        except BaseException:
+            for tmp in (tmp_fn, record_fn):
+                if tmp and os.path.exists(tmp):
+                    os.unlink(tmp)
+            raise
+
+        return file_id
+
+    def open(self, file_id: str) -> BinaryIO:
+        f, is_record = self.open_stored(file_id)
+        if not is_record:
+            return f
+
+        compression, depth, base, _ = codec.unpack_header(f.read(codec.RECORD_HEADER.size))
+        if not depth:
+            return codec.DecompressReader(f, compression, self._CHUNK_SIZE)
+
+        with codec.DecompressReader(f, compression, self._CHUNK_SIZE) as reader:
+            delta = reader.read()
+
+        out = io.BytesIO()
+        with self._open_seekable(base) as f_base:
+            codec.apply_delta(delta, f_base, out)
+        out.seek(0)
+        return out
+
+    def map(self, file_id: str) -> memoryview:
+        """
+        Read-only view of a blob's content. Packed blobs are a slice of the
+        mapped pack and loose blobs are mapped on their own, neither is copied;
+        encoded records are decoded into memory. Release the view when done.
+        """
+        f, is_record = self.open_stored(file_id)
+        with f:
+            if is_record:
+                f.close()
+                with self.open(file_id) as f_in:
+                    return memoryview(f_in.read())
+            if hasattr(f, 'getbuffer'):
+                # the view outlives the BlobView, it keeps the pack mapped by itself
+                return f.getbuffer()[:]
+            return map_file(f)
+
+    def open_stored(self, file_id: str) -> Tuple[BinaryIO, bool]:
+        """
+        :return: the blob data as it is stored and whether it is an encoded record
+        """
+        with self._lock:
+            for rescanned in (False, True):
+                pack = self._find_pack(file_id)
+                try:
+                    if pack is not None:
+                        view, flags = pack.open(file_id)
+                        return view, bool(flags & FLAG_RECORD)
+                except FileNotFoundError:
+                    # the pack was rewritten by another store before we mapped it
+                    pass
+
+                try:
+                    return open(self.loose_path(file_id), 'rb'), False
+                except FileNotFoundError:
+                    pass
+
+                try:
+                    return open(self._record_path(file_id), 'rb'), True
+                except FileNotFoundError:
+                    pass
+
+                # moved into a pack by another store since the last scan, like git re-reading its packs
+                if not rescanned:
+                    self._load_packs(force=True)
+
+            raise FileNotFoundError(f"blob '{file_id}' is missing")
+
+    def checkout(self, file_id: str, fn: str, link: Optional[str] = None):
+        """
+        Atomically replaces ``fn`` with the content of a blob.
+
+        :param link: ``"reflink"`` clones raw loose blobs copy-on-write where the
+            filesystem supports it. ``"hardlink"`` links them into place and makes
+            the blob read-only, so the working file can be replaced but never
+            modified in place. Anything else, and blobs that are not stored raw
+            and loose, is copied.
+        """
+        tmp_fn = os.path.join(os.path.dirname(fn), f"{self._TMP_PREFIX}{uuid.uuid4().hex}")
+        blob_fn = self.loose_path(file_id)
+
+        try:
+            if link == "hardlink" and os.path.isfile(blob_fn):
+                os.chmod(blob_fn, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.link(blob_fn, tmp_fn)
+            elif link == "reflink" and os.path.isfile(blob_fn) and self._reflink(blob_fn, tmp_fn):
+                pass
+            else:
+                self._copy(file_id, tmp_fn)
+
+            os.replace(tmp_fn, fn)
+        except BaseException:
+            if os.path.exists(tmp_fn):
+                os.unlink(tmp_fn)
+            raise
+
+    def info(self, file_id: str) -> dict:
+        f, is_record = self.open_stored(file_id)
+        with f:
+            stored_size = f.seek(0, io.SEEK_END)
+            if not is_record:
+                return {'raw_size': stored_size, 'stored_size': stored_size,
+                        'compression': codec.CODEC_NONE, 'depth': 0, 'base': None}
+
+            f.seek(0)
+            compression, depth, base, raw_size = codec.unpack_header(f.read(codec.RECORD_HEADER.size))
+            return {'raw_size': raw_size, 'stored_size': stored_size,
+                    'compression': compression, 'depth': depth, 'base': base}
+
+    def repack(self, full: bool = False) -> int:
+        """
+        Moves all loose blobs into a new pack.
+
+        :param full: also consolidate all existing packs into the new one
+        :return: number of blobs in the new pack
+        """
+        with self._lock:
+            self._load_packs()
+            file_ids = set(self.iter_loose())
+            old_packs = dict(self._packs) if full else {}
+
+            for pack in old_packs.values():
+                file_ids.update(pack)
+
+            if not file_ids:
+                return 0
+
+            name, count = self._write_pack(file_ids)
+
+            # only what went into the pack, blobs ingested meanwhile stay loose
+            for file_id in file_ids:
+                for fn in (self.loose_path(file_id), self._record_path(file_id)):
+                    try:
+                        os.unlink(fn)
+                    except FileNotFoundError:
+                        pass
+
+            for old_name in old_packs:
+                if old_name != name:
+                    self._drop_pack(old_name)
+
+            logging.info(f"packed {count} blobs into {name}")
+            return count
+
+    def remove(self, file_ids: Iterable[str]) -> int:
+        """
+        Deletes blobs, rewriting the packs that contain any of them.
+
+        Nothing checks whether other blobs are delta-encoded against the removed
+        ones, callers have to keep bases of blobs they keep.
+
+        :return: number of blobs removed
+        """
+        with self._lock:
+            self._load_packs()
+            file_ids = set(file_ids)
+            removed = 0
+
+            for file_id in file_ids:
+                for fn in (self.loose_path(file_id), self._record_path(file_id)):
+                    try:
+                        os.unlink(fn)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+
+            for name, pack in list(self._packs.items()):
+                dropped = file_ids.intersection(pack)
+                if not dropped:
+                    continue
+
+                remaining = set(pack) - dropped
+                if remaining:
+                    new_name, _ = self._write_pack(remaining)
+                    if new_name == name:
+                        continue
+                self._drop_pack(name)
+                removed += len(dropped)
+
+            return removed
+
+    def add_stored(self, file_id: str, f_in: BinaryIO, is_record: bool, owner: Optional[str] = None):
+        """
+        Adds a blob exactly as another store returned it from ``open_stored``.
+
+        :param owner: see ``ingest``
+        """
+        with self._lock:
+            if self.contains(file_id):
+                self._register(owner, [file_id])
+                return
+
+        tmp_fd, tmp_fn = tempfile.mkstemp(dir=self._blobs_path, prefix=self._TMP_PREFIX)
+        try:
+            with os.fdopen(tmp_fd, 'wb') as f_out:
+                for chunk in read_big(f_in, self._CHUNK_SIZE):
+                    f_out.write(chunk)
+
+            with self._lock:
+                if self.contains(file_id):
+                    os.unlink(tmp_fn)
+                else:
+                    os.replace(tmp_fn, self._record_path(file_id) if is_record else self.loose_path(file_id))
+                self._register(owner, [file_id])
+        except BaseException:
+            if os.path.exists(tmp_fn):
+                os.unlink(tmp_fn)
+            raise
+
+    def with_bases(self, file_ids: Iterable[str]) -> Set[str]:
+        """``file_ids`` plus, transitively, the delta bases they are encoded against."""
+        pending = set(file_ids)
+        closure = set()
+        while pending:
+            file_id = pending.pop()
+            closure.add(file_id)
+            try:
+                base = self.info(file_id)['base']
+            except FileNotFoundError:
+                continue
+            if base is not None and base not in closure:
+                pending.add(base)
+
+        return closure
+
+    def remove_unreachable(self, roots: Iterable[str], min_age: float = MIN_AGE) -> int:
+        """
+        Removes every blob that is neither in ``roots`` nor a delta base of one,
+        as well as temporary files left behind by interrupted writes.
+
+        :param min_age: seconds loose blobs are kept regardless, so the blobs of a
+            snapshot that is being saved concurrently survive. Temporary files are
+            always kept for ``MIN_AGE``.
+        :return: number of blobs removed
+        """
+        with self._lock:
+            self._load_packs()
+            reachable = self.with_bases(roots)
+            now = time.time()
+
+            def age(fn):
+                try:
+                    return now - os.path.getmtime(fn)
+                except FileNotFoundError:
+                    return math.inf
+
+            for basename in os.listdir(self._blobs_path):
+                fn = os.path.join(self._blobs_path, basename)
+                if basename.startswith(self._TMP_PREFIX) and age(fn) >= MIN_AGE:
+                    try:
+                        os.unlink(fn)
+                    except FileNotFoundError:
+                        pass
+
+            return self.remove(
+                file_id for file_id in list(self.iter_blobs())
+                if file_id not in reachable
+                and age(self.loose_path(file_id)) >= min_age and age(self._record_path(file_id)) >= min_age
+            )
+
+    def iter_blobs(self) -> Iterator[str]:
+        """Ids of all loose and packed blobs, each once."""
+        seen = set()
+        for file_id in self.iter_loose():
+            seen.add(file_id)
+            yield file_id
+        for pack in list(self._packs.values()):
+            for file_id in pack:
+                if file_id not in seen:
+                    seen.add(file_id)
+                    yield file_id
+
+    def iter_loose(self) -> Iterator[str]:
+        for basename in self._list_loose():
+            yield basename.removesuffix(self._RECORD_SUFFIX)
+
+    def loose_path(self, file_id: str) -> str:
+        return os.path.join(self._blobs_path, file_id)
+
+    def refresh(self):
+        """Picks up packs written and drops packs deleted by other stores on the same directory."""
+        with self._lock:
+            self._load_packs(force=True)
+
+    def close(self):
+        for pack in self._packs.values():
+            pack.close()
+        self._packs.clear()
+
+    def destroy(self):
+        """Closes the store and deletes all of its blobs."""
+        self.close()
+        for path in (self._blobs_path, self._packs_path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _register(self, owner: Optional[str], file_ids: Iterable[str]):
+        # records ``owner`` as a user of just stored blobs, called with the lock held
+        pass
+
+    def _encode(self, tmp_fn: str, base: Optional[str]) -> Optional[str]:
+        # returns a temporary file with the encoded record, or None if the blob
+        # is better stored raw
+        raw_size = os.path.getsize(tmp_fn)
+
+        payload = None
+        depth = 0
+
+        if self._delta and base and self.contains(base):
+            depth = self._get_depth(base) + 1
+            if depth <= self._MAX_DELTA_DEPTH:
+                with open(tmp_fn, 'rb') as f_target, self._open_seekable(base) as f_base:
+                    delta = codec.make_delta(f_target, f_base, raw_size // 2)
+                if delta is not None:
+                    compressor = codec.compressor(self._compression)
+                    payload = compressor.compress(delta) + compressor.flush()
+
+        if payload is None and self._compression == codec.CODEC_NONE:
+            return None
+
+        record_fd, record_fn = tempfile.mkstemp(dir=self._blobs_path, prefix=self._TMP_PREFIX)
+        with os.fdopen(record_fd, 'wb') as f_out:
+            if payload is not None:
+                f_out.write(codec.pack_header(self._compression, depth, base, raw_size))
+                f_out.write(payload)
+            else:
+                f_out.write(codec.pack_header(self._compression, 0, None, raw_size))
+                compressor = codec.compressor(self._compression)
+                with open(tmp_fn, 'rb') as f_in:
+                    for chunk in read_big(f_in, self._CHUNK_SIZE):
+                        f_out.write(compressor.compress(chunk))
+                f_out.write(compressor.flush())
+            stored_size = f_out.tell()
+
+        if stored_size >= raw_size:
+            os.unlink(record_fn)
+            return None
+
+        return record_fn
+
+    def _write_pack(self, file_ids: Iterable[str]) -> Tuple[str, int]:
+        file_ids = sorted(file_ids)
+
+        name_hash = hashlib.sha256()
+        for file_id in file_ids:
+            name_hash.update(bytes.fromhex(file_id))
+        name = os.path.join(self._packs_path, f"pack-{name_hash.hexdigest()[:16]}")
+
+        if name in self._packs:
+            # identical pack already exists, only other copies are redundant
+            return name, len(self._packs[name])
+
+        count = write_pack(name, (
+            (file_id, f, FLAG_RECORD if is_record else 0)
+            for file_id in file_ids
+            for f, is_record in (self.open_stored(file_id),)
+        ), self._CHUNK_SIZE)
+        self._packs[name] = Pack(name)
+        return name, count
+
+    def _drop_pack(self, name: str):
+        pack = self._packs.pop(name)
+        pack.close()
+        os.unlink(pack.index_path)
+        os.unlink(pack.pack_path)
+
+    def _copy(self, file_id: str, dst_fn: str):
+        with open(dst_fn, 'xb') as f_out:
+            f_in, is_record = self.open_stored(file_id)
+
+            if is_record:
+                f_in.close()
+                with self.open(file_id) as f_in:
+                    for chunk in read_big(f_in, self._CHUNK_SIZE):
+                        f_out.write(chunk)
+            elif hasattr(f_in, 'getbuffer'):
+                # packed blob, write straight from the mapped pack
+                with f_in:
+                    f_out.write(f_in.getbuffer())
+            else:
+                with f_in:
+                    self._copy_fd(f_in.fileno(), f_out.fileno(), os.fstat(f_in.fileno()).st_size)
+
+    def _copy_fd(self, fd_in: int, fd_out: int, size: int):
+        # in-kernel copy where available, plain chunked copy otherwise
+        copied = 0
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(fd_in, fd_out, size - copied, copied, copied)
+                    if not n:
+                        return
+                    copied += n
+                return
+            except OSError:
+                pass
+
+        os.lseek(fd_out, copied, os.SEEK_SET)
+
+        if hasattr(os, 'sendfile'):
+            try:
+                while copied < size:
+                    n = os.sendfile(fd_out, fd_in, copied, size - copied)
+                    if not n:
+                        return
+                    copied += n
+                return
+            except OSError:
+                os.lseek(fd_out, copied, os.SEEK_SET)
+
+        os.lseek(fd_in, copied, os.SEEK_SET)
+        while True:
+            chunk = os.read(fd_in, self._CHUNK_SIZE)
+            if not chunk:
+                break
+            os.write(fd_out, chunk)
+
+    def _reflink(self, src_fn: str, dst_fn: str) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            return False
+
+        with open(src_fn, 'rb') as f_in, open(dst_fn, 'xb') as f_out:
+            try:
+                fcntl.ioctl(f_out.fileno(), self._FICLONE, f_in.fileno())
+                return True
+            except OSError:
+                pass
+
+        os.unlink(dst_fn)
+        return False
+
+    def _get_depth(self, file_id: str) -> int:
+        f, is_record = self.open_stored(file_id)
+        with f:
+            if not is_record:
+                return 0
+            return codec.unpack_header(f.read(codec.RECORD_HEADER.size))[1]
+
+    def _open_seekable(self, file_id: str) -> BinaryIO:
+        f = self.open(file_id)
+        if f.seekable():
+            return f
+        with f:
+            return io.BytesIO(f.read())
+
+    def _list_loose(self) -> Iterator[str]:
+        for basename in os.listdir(self._blobs_path):
+            if not basename.startswith(self._TMP_PREFIX):
+                yield basename
+
+    def _record_path(self, file_id: str) -> str:
+        return os.path.join(self._blobs_path, f"{file_id}{self._RECORD_SUFFIX}")
+
+    def _load_packs(self, force: bool = False) -> bool:
+        # rescans packs/ if it changed since the last scan (or always if forced), returns whether it did
+        try:
+            mtime = os.stat(self._packs_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._packs_mtime and not force:
+            return False
+        # taken before listing, a pack added meanwhile changes it again
+        self._packs_mtime = mtime
+
+        names = set()
+        for fn in glob.glob(os.path.join(self._packs_path, "*.idx")):
+            name = os.path.splitext(fn)[0]
+            if not os.path.isfile(f"{name}.pack"):
+                continue
+            names.add(name)
+            if name in self._packs:
+                continue
+            try:
+                self._packs[name] = Pack(name)
+            except (OSError, ValueError):
+                logging.exception(f"skipping invalid pack {name}")
+
+        # views taken from a dropped pack stay valid, see ``Pack.close``
+        for name in set(self._packs) - names:
+            self._packs.pop(name).close()
+        return True
+
+    def _find_pack(self, file_id: str):
+        for pack in list(self._packs.values()):
+            if file_id in pack:
+                return pack
+        return None
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def packs(self):
+        return list(self._packs.values())
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def delta(self):
+        return self._delta
@@ -0,0 +1,81 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Optional
+
+# (files done, files total, path of the file just processed)
+FileProgressCallback = Callable[[int, int, str], None]
+
+_MAX_WORKERS = 4
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    """Raised by an operation that stopped because it was asked to, leaving the repository as it was."""
+
+
+class Task:
+    """
+    Handle of a repository operation running in the background.
+
+    Wraps a ``concurrent.futures.Future`` (``future``) and can be awaited from
+    asyncio. ``cancel`` asks the running operation to stop at the next file;
+    it then raises ``Cancelled`` from ``result``.
+    """
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, future: concurrent.futures.Future, cancel_event: threading.Event):
+        self._future = future
+        self._cancel_event = cancel_event
+
+    # ---------------------- Public Methods ----------------------
+
+    def cancel(self):
+        self._cancel_event.set()
+        self._future.cancel()
+
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        try:
+            return self._future.result(timeout)
+        except concurrent.futures.CancelledError as e:
+            # cancelled before it even started
+            raise Cancelled() from e
+
+    def add_done_callback(self, callback: Callable[['Task'], None]):
+        """``callback`` runs on the worker thread (or right away if already done)."""
+        self._future.add_done_callback(lambda _: callback(self))
+
+    # ----------------- Overrides and Interfaces -----------------
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def future(self) -> concurrent.futures.Future:
+        return self._future
+
+
+def submit(func: Callable[..., Any], *args, **kwargs) -> Task:
+    """
+    Runs ``func(*args, cancel=<event>, **kwargs)`` on the shared pool of
+    repository workers.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(_MAX_WORKERS, thread_name_prefix="vcs")
+
+    cancel_event = threading.Event()
+    return Task(_executor.submit(func, *args, cancel=cancel_event, **kwargs), cancel_event)
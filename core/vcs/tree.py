@@ -0,0 +1,115 @@
+import hashlib
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import ujson
+
+_FILE = "f"
+_DIR = "d"
+
+
+class TreeDiff(NamedTuple):
+    added: List[str]
+    removed: List[str]
+    modified: List[str]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+
+def diff_files(a: Dict[str, str], b: Dict[str, str]) -> TreeDiff:
+    """Files added, removed and modified from the flat tree ``a`` to ``b``, sorted."""
+    # set operations on the item views run in C, only changed entries reach Python
+    old = a.items() - b.items()
+    new = b.items() - a.items()
+    return TreeDiff(
+        sorted(fn for fn, _ in new if fn not in a),
+        sorted(fn for fn, _ in old if fn not in b),
+        sorted(fn for fn, _ in old if fn in b),
+    )
+
+
+class Tree:
+    """
+    Merkle view of a snapshot tree (``path -> blob id``).
+
+    Every directory under ``root`` is hashed over the names, kinds and ids of
+    its entries, a subdirectory's id being its own hash. Two trees with the same
+    ``hash`` are identical, which is all ``Repository.diff`` uses them for;
+    different trees are compared flat with ``diff_files``.
+
+    ``dirs`` (``directory -> [hash, number of files under it]``) is stored with
+    every snapshot; directories passed in ``known`` take their hash from there
+    instead of being hashed again.
+    """
+
+    # ----------------------- Constructor ------------------------
+
+    def __init__(self, files_by_dir: Dict[str, Dict[str, str]], root: str,
+                 known: Optional[Dict[str, str]] = None):
+        """
+        :param files_by_dir: ``directory -> name -> blob id`` of every directory holding files
+        :param known: hashes of directories known to be unchanged, e.g. from the parent snapshot
+        """
+        self._root = root
+        # directory -> name -> (kind, id)
+        entries_by_dir: Dict[str, Dict[str, Tuple[str, Optional[str]]]] = {root: {}}
+        counts: Dict[str, int] = {root: 0}
+
+        for path, files in files_by_dir.items():
+            entries_by_dir.setdefault(path, {}).update((name, (_FILE, file_id)) for name, file_id in files.items())
+            counts[path] = counts.get(path, 0) + len(files)
+
+            # link the directory into its parents, up to the first one already linked
+            while path != root:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    raise ValueError(f"{path} is outside of {root}")
+
+                siblings = entries_by_dir.setdefault(parent, {})
+                if os.path.basename(path) in siblings:
+                    break
+                siblings[os.path.basename(path)] = (_DIR, None)
+                counts.setdefault(parent, 0)
+                path = parent
+
+        known = known or {}
+        self._dirs: Dict[str, List] = {}
+
+        # deepest first, so subdirectories are done before their parents
+        for path in sorted(entries_by_dir, key=lambda p: p.count(os.sep), reverse=True):
+            entries = entries_by_dir[path]
+            count = counts[path]
+            for name, (kind, _) in entries.items():
+                if kind == _DIR:
+                    sub_hash, sub_count = self._dirs[os.path.join(path, name)]
+                    entries[name] = (_DIR, sub_hash)
+                    count += sub_count
+
+            dir_hash = known.get(path)
+            if dir_hash is None:
+                data = ujson.dumps(sorted((name, kind, entry_id) for name, (kind, entry_id) in entries.items()))
+                dir_hash = hashlib.sha256(data.encode("utf-8")).hexdigest()
+            self._dirs[path] = [dir_hash, count]
+
+    @classmethod
+    def from_files(cls, files: Dict[str, str], root: str, known: Optional[Dict[str, str]] = None) -> 'Tree':
+        files_by_dir: Dict[str, Dict[str, str]] = {}
+        for fn, file_id in files.items():
+            files_by_dir.setdefault(os.path.dirname(fn), {})[os.path.basename(fn)] = file_id
+        return cls(files_by_dir, root, known)
+
+    # ------------------------ Properties ------------------------
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def hash(self) -> str:
+        return self._dirs[self._root][0]
+
+    @property
+    def dirs(self) -> Dict[str, List]:
+        """``directory -> [hash, number of files under it]``, as stored with a snapshot."""
+        return self._dirs
@@ -1,45 +1,339 @@
 import hashlib
 import logging
 import os.path
-import pickle
+import re
+import shutil
+import threading
 import time
-from typing import Optional, Dict, BinaryIO, Union
+import uuid
+import weakref
+from typing import Optional, BinaryIO, Union, Callable, List, Set, Iterator, Dict, Tuple
 
 import ujson
 
-from core.util.filedict import NamedFileDict, field
+from core.util.filedict import NamedFileDict, field, is_temp_file
+from core.util.trace import tracer
+from .index import StatIndex
+from .log import SnapshotLog
+from .codec import CODEC_NONE
+from .fsck import FsckResult, verify_blobs
+from .shared import SharedBlobStore
+from .store import MIN_AGE, BlobStore, map_file, read_big
+from .tasks import Cancelled, FileProgressCallback, Task, submit
+from .tree import Tree, TreeDiff, diff_files
+
+
+# one lock per working tree, shared by every Repository object opened on it in this process
+_locks: Dict[str, threading.RLock] = {}
+# live Repository objects per working tree, a migration to a shared store switches all of them
+_open: Dict[str, 'weakref.WeakSet[Repository]'] = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.RLock:
+    with _locks_lock:
+        return _locks.setdefault(path, threading.RLock())
+
+
+def _opened(repository: 'Repository') -> List['Repository']:
+    """Registers ``repository`` and returns every live one of the same working tree."""
+    with _locks_lock:
+        repositories = _open.setdefault(repository._path, weakref.WeakSet())
+        repositories.add(repository)
+        return list(repositories)
 
 
 class RepositoryMeta(NamedFileDict):
+    _MAX_AGE = 1.0
+
     head: Optional[str] = field(default=None)
     current: Optional[str] = field(default=None)
+    compression: str = field(default=CODEC_NONE)
+    delta: bool = field(default=False)
+    # shared blob store, relative to the repository, None if blobs are kept in .vcs
+    store: Optional[str] = field(default=None)
 
 
 class Repository:
     _VCS_DIRNAME = ".vcs"
-    _SNAPSHOTS_DIR = os.path.join(_VCS_DIRNAME, "snapshots")
-    _BLOBS_DIR = os.path.join(_VCS_DIRNAME, "blobs")
+    _CHUNK_SIZE = 1024 * 1024
+    _BLOB_ID = re.compile(r"[0-9a-f]{64}")
 
     # ----------------------- Constructor ------------------------
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, store: Optional[SharedBlobStore] = None):
+        """
+        :param store: shared blob store to use, the repository's own blobs are
+            moved into it on first use. Once moved, the repository finds the
+            store on its own if opened without it.
+        """
         self._path = os.path.abspath(path)
+        self._lock = _lock_for(self._path)
 
         self._vcs_path = os.path.join(self._path, self._VCS_DIRNAME)
-        self._snapshots_path = os.path.join(self._path, self._SNAPSHOTS_DIR)
-        self._blobs_path = os.path.join(self._path, self._BLOBS_DIR)
-        self._snapshots: Dict[str, dict] = {}
 
         os.makedirs(self._vcs_path, exist_ok=True)
-        os.makedirs(self._snapshots_path, exist_ok=True)
-        os.makedirs(self._blobs_path, exist_ok=True)
 
         self.meta = RepositoryMeta(os.path.join(self._vcs_path, "repository.json"))
-        self._load_history()
+        self._index = StatIndex(os.path.join(self._vcs_path, "index.json"))
+        self._log = SnapshotLog(self._vcs_path)
+        self._listeners: List[Callable[['Repository'], None]] = []
+        _opened(self)
+
+        with self._lock:
+            # another handle may have migrated the blobs just now
+            self.meta.invalidate()
+            if store is None and self.meta.store is not None:
+                store = SharedBlobStore(os.path.normpath(os.path.join(self._path, self.meta.store)))
+
+            if store is None:
+                self._store = BlobStore(self._vcs_path, self.meta.compression, self.meta.delta)
+            else:
+                self._store = store
+                if self.meta.store is None:
+                    self._migrate(store)
 
     # ---------------------- Public Methods ----------------------
 
-    def save_snapshot(self, description: str = ""):
+    @tracer.traced("vcs.save_snapshot")
+    def save_snapshot(self, description: str = "", rehash: bool = False,
+                      progress: Optional[FileProgressCallback] = None, cancel: Optional[threading.Event] = None):
+        """
+        Operations on the same working tree are serialized, also across threads.
+
+        :param rehash: ignore the stat index and read and hash every file again
+        :param progress: called after every file with ``(done, total, path)``
+        :param cancel: checked between files; once set, the snapshot is abandoned
+            and ``Cancelled`` raised. Blobs stored so far are kept for the next
+            attempt (``gc`` drops them otherwise).
+        """
+        with self._lock:
+            self._sync()
+            return self._save_snapshot(description, rehash, progress, cancel)
+
+    def save_snapshot_async(self, description: str = "", rehash: bool = False,
+                            progress: Optional[FileProgressCallback] = None) -> Task:
+        """``save_snapshot`` on a worker thread, ``progress`` is called from there."""
+        return submit(self.save_snapshot, description, rehash, progress)
+
+    @tracer.traced("vcs.load_snapshot")
+    def load_snapshot(self, snapshot_hash: str, link: Optional[str] = None,
+                      progress: Optional[FileProgressCallback] = None, cancel: Optional[threading.Event] = None):
+        """
+        Checks out a snapshot. Only files that differ from the working tree are written.
+        Operations on the same working tree are serialized, also across threads.
+
+        :param link: ``"reflink"`` or ``"hardlink"`` to link raw blobs into the working
+            tree instead of copying them, see ``BlobStore.checkout``
+        :param progress: called after every file of the snapshot with ``(done, total, path)``
+        :param cancel: checked between files; once set, the files written so far
+            are restored to the current snapshot and ``Cancelled`` raised
+        """
+        with self._lock:
+            self._sync()
+            return self._load_snapshot(snapshot_hash, link, progress, cancel)
+
+    def load_snapshot_async(self, snapshot_hash: str, link: Optional[str] = None,
+                            progress: Optional[FileProgressCallback] = None) -> Task:
+        """``load_snapshot`` on a worker thread, ``progress`` is called from there."""
+        return submit(self.load_snapshot, snapshot_hash, link, progress)
+
+    def open_file(self, fn: str, snapshot_hash: str = None) -> BinaryIO:
+        fn = self.normpath(fn)
+        if snapshot_hash:
+            snapshot_data = self._log.get(snapshot_hash)
+            try:
+                file_id = snapshot_data['tree'][fn]
+            except KeyError as e:
+                raise FileNotFoundError(fn) from e
+            return self._store.open(file_id)
+
+        return open(fn, 'rb')
+
+    def tree(self, snapshot_hash: Optional[str]) -> Tree:
+        """Merkle tree of a snapshot, or the empty tree for None."""
+        if snapshot_hash is None:
+            return Tree({}, self._path)
+
+        # directory hashes stored with the snapshot are taken as they are
+        snapshot_data = self._log.get(snapshot_hash)
+        known = {path: entry[0] for path, entry in snapshot_data.get('dirs', {}).items()}
+        return Tree.from_files(snapshot_data['tree'], self._path, known)
+
+    def diff(self, snapshot_a: Optional[str], snapshot_b: Optional[str]) -> TreeDiff:
+        """
+        Files added, removed and modified from snapshot ``a`` to ``b`` (None is
+        the empty tree).
+
+        Only snapshots with the same root hash are answered from their headers.
+        Any other pair reads both trees from the log and compares them flat, in
+        time proportional to the number of files rather than to the change.
+        """
+        if snapshot_a is not None and snapshot_b is not None and (
+                snapshot_a == snapshot_b or self._root_hash(snapshot_a) == self._root_hash(snapshot_b)):
+            return TreeDiff([], [], [])
+        return diff_files(self._tree_files(snapshot_a), self._tree_files(snapshot_b))
+
+    def map_file(self, fn: str, snapshot_hash: str = None) -> memoryview:
+        """
+        Read-only view of a file in a snapshot (see ``BlobStore.map``) or of the
+        working file, mapped instead of read. Files replaced by ``write_file`` or
+        a checkout keep their old content in views taken before.
+        """
+        fn = self.normpath(fn)
+        if snapshot_hash:
+            snapshot_data = self._log.get(snapshot_hash)
+            try:
+                file_id = snapshot_data['tree'][fn]
+            except KeyError as e:
+                raise FileNotFoundError(fn) from e
+            return self._store.map(file_id)
+
+        with open(fn, 'rb') as f:
+            return map_file(f)
+
+    def write_file(self, fn: str, content: Union[bytes, bytearray, memoryview, BinaryIO]):
+        """
+        Atomically replaces a working file, readers see either the old or the new content.
+
+        :param content: any buffer-protocol object, written without copying,
+            or a readable binary stream, copied in chunks
+        """
+        fn = self.normpath(fn)
+        tmp_fn = os.path.join(os.path.dirname(fn), f".tmp-{uuid.uuid4().hex}")
+
+        # a snapshot saved meanwhile would pick up the temporary file
+        with self._lock:
+            try:
+                with open(tmp_fn, 'xb') as f:
+                    if hasattr(content, 'read'):
+                        shutil.copyfileobj(content, f, self._CHUNK_SIZE)
+                    else:
+                        f.write(memoryview(content))
+                os.replace(tmp_fn, fn)
+            except BaseException:
+                if os.path.exists(tmp_fn):
+                    os.unlink(tmp_fn)
+                raise
+
+    def file_id(self, fn: str, snapshot_hash: str = None) -> Optional[str]:
+        """
+        Blob id of ``fn`` in a snapshot, or of the working file if the stat index
+        vouches for it (None otherwise, the working file is never hashed here).
+        """
+        fn = self.normpath(fn)
+        if snapshot_hash:
+            return self._log.get(snapshot_hash)['tree'].get(fn)
+
+        try:
+            return self._index.lookup(fn, os.stat(fn))
+        except FileNotFoundError:
+            return None
+
+    def cache_path(self, *parts: str) -> str:
+        """
+        Directory for derived data (e.g. previews) kept alongside the repository.
+        Entries named after a blob id are dropped by ``gc`` once the blob is gone.
+        """
+        path = os.path.join(self._vcs_path, "cache", *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def subscribe(self, callback: Callable[['Repository'], None]):
+        """Calls ``callback`` after every saved or loaded snapshot."""
+        self._listeners.append(callback)
+
+    def repack(self, full: bool = False) -> int:
+        with self._lock:
+            return self._store.repack(full)
+
+    def reachable(self) -> Set[str]:
+        """Blobs used by any snapshot or the working tree, plus the delta bases they need."""
+        file_ids = self._index.file_ids()
+        for header in self._log:
+            file_ids.update(self._log.get(header['hash'])['tree'].values())
+        return self._store.with_bases(file_ids)
+
+    def refresh_refs(self):
+        """Re-registers everything this repository uses with its shared store."""
+        # under the lock, a snapshot being saved is either in reachable() or not started yet
+        with self._lock:
+            if self.shared:
+                self._store.set_refs(self._store.owner_key(self._path), self.reachable())
+
+    def gc(self, min_age: float = MIN_AGE) -> int:
+        """
+        Removes blobs no snapshot uses, and cached data derived from them.
+
+        With a shared store, this repository's references are refreshed and the
+        store is pruned; blobs other repositories use are kept.
+
+        :param min_age: seconds new loose blobs are kept regardless, see ``BlobStore.remove_unreachable``
+        :return: number of blobs removed
+        """
+        with self._lock:
+            self._sync()
+            if self.shared:
+                self.refresh_refs()
+                removed = self._store.prune(min_age)
+            else:
+                removed = self._store.remove_unreachable(self.reachable(), min_age)
+
+            self.prune_cache()
+            return removed
+
+    def fsck(self, workers: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None
+             ) -> FsckResult:
+        """
+        Re-hashes every blob the repository uses on a process pool.
+
+        :param progress: called with ``(checked, total)``
+        """
+        reachable = self.reachable()
+        present = [file_id for file_id in reachable if self._store.contains(file_id)]
+        missing = sorted(reachable.difference(present))
+
+        result = verify_blobs(((self._store.path, file_id) for file_id in present), workers, progress)
+        return result._replace(missing=missing)
+
+    def prune_cache(self):
+        """Drops cached data of blobs that are no longer stored."""
+        cache_path = os.path.join(self._vcs_path, "cache")
+        if not os.path.isdir(cache_path):
+            return
+
+        for kind in os.scandir(cache_path):
+            if not kind.is_dir():
+                continue
+            for entry in os.scandir(kind.path):
+                # unfinished entries are only removed once nobody can still be writing them
+                stale = (entry.name.startswith(".tmp-") and entry.stat().st_mtime < time.time() - MIN_AGE) or (
+                    self._BLOB_ID.fullmatch(entry.name) and not self._store.contains(entry.name)
+                )
+                if not stale:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.unlink(entry.path)
+
+    def set_storage(self, compression: str = CODEC_NONE, delta: bool = False):
+        """
+        Chooses how new blobs are stored, existing blobs are left as they are.
+        With a shared store this applies to every repository using it.
+
+        :param compression: one of ``"none"``, ``"zlib"``, ``"lzma"``
+        :param delta: delta-encode blobs against the previous version of the same file
+        """
+        self._store.configure(compression, delta)
+        with self.meta.batch():
+            self.meta.compression = compression
+            self.meta.delta = delta
+
+    # -------------- Protected and Private Methods ---------------
+
+    def _save_snapshot(self, description: str, rehash: bool, progress: Optional[FileProgressCallback],
+                       cancel: Optional[threading.Event]):
         snapshot_hash = hashlib.sha256()
         snapshot_data = {
             'tree': {},
@@ -47,114 +341,273 @@ class Repository:
             'parent': self.meta.current
         }
 
-        for root, _, files in os.walk(self._path):
-            if self._VCS_DIRNAME in root:
-                continue
-
+        if rehash:
+            self._index.clear()
+
+        parent = self._log.get(self.meta.current) if self.meta.current else None
+        parent_tree = parent['tree'] if parent is not None else {}
+        owner = self._store.owner_key(self._path) if self.shared else None
+        ingested = 0
+
+        # directory -> name -> blob id, grouped as walked so the tree needs no path splitting
+        files_by_dir: Dict[str, Dict[str, str]] = {}
+        # temp files of meta writes (which don't take the repository lock) come and go, never commit them
+        walked = [
+            (root, [basename for basename in files if not is_temp_file(basename)])
+            for root, _, files in os.walk(self._path) if self._VCS_DIRNAME not in root and files
+        ]
+        total = sum(len(files) for _, files in walked)
+        done = 0
+
+        for root, files in walked:
+            dir_files = {}
             for basename in files:
-                fn = os.path.join(root, basename)
+                if cancel is not None and cancel.is_set():
+                    # entries added so far point at stored blobs and stay valid
+                    self._index.save()
+                    raise Cancelled(f"saving a snapshot of {self._path}")
 
-                with open(fn, 'rb') as f:
-                    data = f.read()
-
-                snapshot_hash.update(data)
-
-                file_id = hashlib.sha256(data).hexdigest()
-                snapshot_data['tree'][fn] = file_id
-
-                blob_fn = os.path.join(self._blobs_path, file_id)
-                if not os.path.isfile(blob_fn):
-                    with open(blob_fn, 'wb') as f:
-                        f.write(data)
-
-        if self.meta.current:
-            current = self._snapshots[self.meta.current]
-            if set(current['tree'].items()) == set(snapshot_data['tree'].items()):
-                logging.warning("nothing to commit")
-                return
+                fn = os.path.join(root, basename)
+                done += 1
+                try:
+                    st = os.stat(fn)
+
+                    file_id = self._index.lookup(fn, st)
+                    if file_id is None or not self._store.contains(file_id):
+                        # referenced right away, a concurrent prune of a shared store keeps it
+                        file_id = self._store.ingest(fn, parent_tree.get(fn), owner)
+                        self._index.update(fn, st, file_id)
+                        ingested += 1
+                except FileNotFoundError:
+                    # removed since the walk listed it, the snapshot is taken without it
+                    file_id = None
+
+                if file_id is not None:
+                    snapshot_hash.update(bytes.fromhex(file_id))
+                    snapshot_data['tree'][fn] = file_id
+                    dir_files[basename] = file_id
+
+                if progress is not None:
+                    progress(done, total, fn)
+
+            if dir_files:
+                files_by_dir[root] = dir_files
+
+        self._index.retain(snapshot_data['tree'])
+        self._index.save()
+
+        tracer.count("vcs.files_ingested", ingested)
+        tracer.count("vcs.files_unchanged", len(snapshot_data['tree']) - ingested)
+
+        if parent is not None and snapshot_data['tree'] == parent_tree:
+            logging.warning("nothing to commit")
+            return
 
+        # only directories with changes are hashed, the rest keep the parent's hashes
+        tree = Tree(files_by_dir, self._path, self._unchanged_dirs(parent, snapshot_data['tree']))
+        snapshot_data['root'] = tree.hash
+        snapshot_data['dirs'] = tree.dirs
         snapshot_hash.update(ujson.dumps(snapshot_data).encode("utf-8"))
         snapshot_hash = snapshot_hash.hexdigest()
 
         snapshot_data['hash'] = snapshot_hash
         snapshot_data['timestamp'] = time.time()
 
-        with open(os.path.join(self._snapshots_path, snapshot_hash), 'wb') as f:
-            pickle.dump(snapshot_data, f)
+        self._log.append(snapshot_data)
 
         self.meta.current = snapshot_hash
-        self._snapshots[snapshot_hash] = snapshot_data
+        self._notify()
 
-    def load_snapshot(self, snapshot_hash: str):
+    def _load_snapshot(self, snapshot_hash: str, link: Optional[str], progress: Optional[FileProgressCallback],
+                       cancel: Optional[threading.Event]):
         if self.meta.current == snapshot_hash:
             logging.warning(f"currently at '{snapshot_hash}'")
             return
 
-        snapshot_data = self._snapshots[snapshot_hash]
-
-        for fn, file_id in snapshot_data['tree'].items():
-            with (
-                open(os.path.join(self._blobs_path, file_id), 'rb') as f_in,
-                open(fn, 'wb') as f_out,
-            ):
-                for chunk in self.read_big(f_in):
-                    f_out.write(chunk)
-
-        existing_files = set()
-        for root, _, files in os.walk(self._path):
-            if self._VCS_DIRNAME in root:
-                continue
-            for basename in files:
-                existing_files.add(os.path.join(root, basename))
-
-        files_to_remove = existing_files - set(snapshot_data['tree'].keys())
-        for fn in files_to_remove:
-            os.unlink(fn)
+        target_tree = self._log.get(snapshot_hash)['tree']
+        current_tree = self._log.get(self.meta.current)['tree'] if self.meta.current else {}
+        # files removed or written so far, in order, for restoring an interrupted checkout
+        touched = []
+        written = 0
+
+        # files of the current snapshot that are gone in the target go first, a
+        # directory may become a file of the same name
+        for fn in self.diff(self.meta.current, snapshot_hash).removed:
+            if os.path.isfile(fn):
+                os.unlink(fn)
+                self._remove_empty_dirs(os.path.dirname(fn))
+                touched.append(fn)
+
+        for done, (fn, file_id) in enumerate(target_tree.items(), start=1):
+            if cancel is not None and cancel.is_set():
+                self._restore(touched, current_tree)
+                raise Cancelled(f"loading snapshot '{snapshot_hash}' into {self._path}")
+
+            if not self._is_clean(fn, file_id):
+                os.makedirs(os.path.dirname(fn), exist_ok=True)
+                self._store.checkout(file_id, fn, link)
+                self._index.update(fn, os.stat(fn), file_id)
+                touched.append(fn)
+                written += 1
+
+            if progress is not None:
+                progress(done, len(target_tree), fn)
+
+        tracer.count("vcs.files_checked_out", written)
+
+        # anything else the last save / checkout saw that the target doesn't have,
+        # it can't be restored so it goes only once nothing can be cancelled anymore
+        for fn in [fn for fn in self._index if fn not in target_tree and fn not in current_tree]:
+            if os.path.isfile(fn):
+                os.unlink(fn)
+
+        self._index.retain(target_tree)
+        self._index.save()
 
         self.meta.current = snapshot_hash
-
-    def open_file(self, fn: str, snapshot_hash: str = None):
-        fn = self.normpath(fn)
-        if snapshot_hash:
-            snapshot_data = self._snapshots[snapshot_hash]
+        self._notify()
+
+    def _migrate(self, store: SharedBlobStore):
+        # copy first and record the move last, an interrupted migration just runs again
+        own = BlobStore(self._vcs_path)
+        owner = store.owner_key(self._path)
+        for file_id in own.iter_blobs():
+            f, is_record = own.open_stored(file_id)
+            with f:
+                # every blob is referenced as it arrives, the next gc drops what no snapshot uses
+                store.add_stored(file_id, f, is_record, owner)
+        self.meta.store = os.path.relpath(store.path, self._path)
+
+        # other handles of this working tree would still read the blobs deleted below
+        for repository in _opened(self):
+            # handles still being constructed pick up meta.store once they get the lock
+            if repository is not self and hasattr(repository, '_store') and not repository.shared:
+                repository._store.close()
+                repository._store = store
+                repository.meta.invalidate()
+        own.destroy()
+
+        logging.info(f"moved the blobs of {self._path} into {store.path}")
+
+    def _root_hash(self, snapshot_hash: str) -> str:
+        root = self._log.header(snapshot_hash).get('root')
+        return root if root is not None else self.tree(snapshot_hash).hash
+
+    def _tree_files(self, snapshot_hash: Optional[str]) -> Dict[str, str]:
+        return self._log.get(snapshot_hash)['tree'] if snapshot_hash is not None else {}
+
+    def _unchanged_dirs(self, parent: Optional[dict], files: Dict[str, str]) -> Dict[str, str]:
+        # hashes of the parent's directories none of whose files were added, removed or changed
+        if parent is None or 'dirs' not in parent:
+            return {}
+
+        changed = [fn for fn, _ in files.items() - parent['tree'].items()]
+        changed.extend(parent['tree'].keys() - files.keys())
+
+        dirty = set()
+        for fn in changed:
+            path = os.path.dirname(fn)
+            while path not in dirty:
+                dirty.add(path)
+                if path == self._path:
+                    break
+                path = os.path.dirname(path)
+
+        return {path: entry[0] for path, entry in parent['dirs'].items() if path not in dirty}
+
+    def _sync(self):
+        # another Repository object of the same working tree may have written since
+        self.meta.invalidate()
+        self._log.refresh()
+        self._index.refresh()
+        self._store.refresh()
+
+    def _restore(self, paths: List[str], tree: dict):
+        # puts files back the way ``tree`` has them after an interrupted checkout,
+        # latest first so a file written over a removed directory is gone before it comes back
+        for fn in reversed(paths):
+            if fn in tree:
+                os.makedirs(os.path.dirname(fn), exist_ok=True)
+                self._store.checkout(tree[fn], fn)
+                self._index.update(fn, os.stat(fn), tree[fn])
+            elif os.path.isfile(fn):
+                os.unlink(fn)
+                self._remove_empty_dirs(os.path.dirname(fn))
+
+        self._index.retain(set(self._index).difference(set(paths).difference(tree)))
+        self._index.save()
+
+    def _remove_empty_dirs(self, path: str):
+        while path != self._path and path.startswith(self._path):
             try:
-                file = os.path.join(self._blobs_path, snapshot_data['tree'][fn])
-            except KeyError as e:
-                raise FileNotFoundError(fn) from e
-        else:
-            file = fn
-
-        return open(file, 'rb')
+                os.rmdir(path)
+            except OSError:
+                # not empty
+                return
+            path = os.path.dirname(path)
 
-    # -------------- Protected and Private Methods ---------------
+    def _notify(self):
+        for callback in self._listeners:
+            callback(self)
 
-    def _load_history(self):
-        for snapshot in os.listdir(self._snapshots_path):
-            fn = os.path.join(self._snapshots_path, snapshot)
-            with open(fn, 'rb') as f:
-                self._snapshots[snapshot] = pickle.load(f)
+    def _is_clean(self, fn: str, file_id: str) -> bool:
+        try:
+            st = os.stat(fn)
+        except FileNotFoundError:
+            return False
+        return self._index.lookup(fn, st) == file_id
 
     # ---------------------- Static Methods ----------------------
 
     # ------------------------ Properties ------------------------
 
-    @property
-    def history(self):
-        return sorted(self._snapshots.values(), key=lambda x: x['timestamp'], reverse=True)
+    def get_snapshot(self, snapshot_hash: str) -> dict:
+        return self._log.get(snapshot_hash)
+
+    def history(self, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        """Snapshot headers (without trees), newest first, ``limit`` of them after skipping ``offset``."""
+        return self._log.page(limit, offset)
+
+    def iter_history(self, newest_first: bool = True) -> Iterator[dict]:
+        return self._log.iter_headers(newest_first)
+
+    def ancestors(self, snapshot_hash: str, include_self: bool = False) -> Iterator[dict]:
+        """Headers along the parent links of a snapshot, nearest first."""
+        return self._log.ancestors(snapshot_hash, include_self)
+
+    def children(self, snapshot_hash: str) -> List[dict]:
+        """Headers of the snapshots saved on top of a snapshot."""
+        return self._log.children(snapshot_hash)
 
     @property
     def current(self):
         return self.meta.current
 
+    @property
+    def snapshot_count(self):
+        return len(self._log)
+
+    @property
+    def last_snapshot_time(self) -> Optional[float]:
+        latest = self._log.latest()
+        return latest['timestamp'] if latest else None
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def shared(self) -> bool:
+        return isinstance(self._store, SharedBlobStore)
+
     # ---------------------- Helper Methods ----------------------
 
+    read_big = staticmethod(read_big)
+
     @staticmethod
-    def read_big(f: BinaryIO, chunk_size=4096):
-        while True:
-            data = f.read(chunk_size)
-            if not data:
-                break
-            yield data
+    def read_summary(path: str) -> Tuple[int, Optional[float]]:
+        """Snapshot count and newest timestamp of the repository at ``path``, without opening it."""
+        return SnapshotLog.read_summary(os.path.join(path, Repository._VCS_DIRNAME))
 
     @staticmethod
     def normpath(path: Union[str, os.PathLike]):
@@ -1,26 +1,71 @@
-from typing import TYPE_CHECKING, Optional
+import itertools
+from typing import TYPE_CHECKING, Optional, Dict
 
-from PyQt5 import QtWidgets, QtGui
+from PyQt5 import QtWidgets, QtGui, QtCore
 
-from .window import ComparerWindowWidget
+from core.util.lru import ByteLRUCache
+from .loader import ImageLoader, DiffLoader, PyramidLoader
+from .window import ComparerWindowWidget, _pixmap_size
 
 if TYPE_CHECKING:
+    from core.imaging.pyramid import TilePyramid
     from core.project.image import ProjectImage
 
 
+def _heatmap_image(heatmap) -> QtGui.QImage:
+    import numpy as np
+
+    # black -> red -> yellow as the difference grows
+    height, width = heatmap.shape
+    rgb = np.zeros((height, width, 3), np.uint8)
+    rgb[..., 0] = np.minimum(heatmap.astype(np.uint16) * 4, 255)
+    rgb[..., 1] = np.clip(heatmap.astype(np.int16) * 4 - 255, 0, 255)
+
+    return QtGui.QImage(rgb.data, width, height, width * 3, QtGui.QImage.Format_RGB888).copy()
+
+
 class ComparerWidget(QtWidgets.QWidget):
+    _CACHE_BYTES = 512 * 1024 * 1024
+    _LEFT = "left"
+    _RIGHT = "right"
+    _DIFF = "diff"
+    _HISTORY_PAGE_SIZE = 100
+    # item data of the entry that loads the next history page, never a snapshot hash
+    _MORE = "more"
 
     def __init__(self):
         super().__init__()
 
         self._image: Optional['ProjectImage'] = None
+        self._history_loaded = 0
+
+        # decoded previews keyed by blob hash, identical content in different snapshots shares an entry
+        self._cache = ByteLRUCache(self._CACHE_BYTES, _pixmap_size)
+        # full widths of the previews and their pyramids, once zooming in asked for one
+        self._widths: Dict[str, int] = {}
+        self._pyramids: Dict[str, 'TilePyramid'] = {}
+        # version shown per side, for loading its pyramid on demand
+        self._shown: Dict[str, Optional[str]] = {}
+
+        # reads and decodes run on the pool, only the latest request per side is applied
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+        self._request_ids = itertools.count(1)
+        self._latest: Dict[str, int] = {}
+        self._requests: Dict[int, tuple] = {}
 
         self._cb_left = QtWidgets.QComboBox()
         self._cb_right = QtWidgets.QComboBox()
 
+        self._chk_diff = QtWidgets.QCheckBox("Diff")
+        self._lbl_metrics = QtWidgets.QLabel()
+
         cb_layout = QtWidgets.QHBoxLayout()
         cb_layout.addWidget(self._cb_left)
         cb_layout.addItem(QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum))
+        cb_layout.addWidget(self._lbl_metrics)
+        cb_layout.addWidget(self._chk_diff)
+        cb_layout.addItem(QtWidgets.QSpacerItem(20, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum))
         cb_layout.addWidget(self._cb_right)
 
         layout = QtWidgets.QVBoxLayout()
@@ -32,11 +77,14 @@ class ComparerWidget(QtWidgets.QWidget):
         layout.addWidget(self._window)
         self.setLayout(layout)
 
+        self._window.detail_requested.connect(self._request_pyramid)
         self._cb_left.currentTextChanged.connect(self.handle_left_option_change)
         self._cb_right.currentTextChanged.connect(self.handle_right_option_change)
+        self._chk_diff.toggled.connect(self.handle_diff_toggle)
 
     def set_image(self, image: 'ProjectImage'):
         self._image = image
+        self._history_loaded = 0
 
         self._cb_right.clear()
         self._cb_left.clear()
@@ -44,22 +92,172 @@ class ComparerWidget(QtWidgets.QWidget):
         self._cb_left.addItem(f"local", None)
         self._cb_right.addItem(f"local", None)
 
-        for item in image.history:
-            self._cb_left.addItem(f"[{item['hash'][:8]}] {item['description']}", item['hash'])
-            self._cb_right.addItem(f"[{item['hash'][:8]}] {item['description']}", item['hash'])
+        self._load_history_page()
 
     def handle_left_option_change(self):
-        snapshot_hash = self._cb_left.currentData()
-        image_data = self._image.read_version(snapshot_hash)
-        pixmap = QtGui.QPixmap()
-        pixmap.loadFromData(image_data)
-
-        self._window.set_left(pixmap)
+        if self._cb_left.currentData() == self._MORE:
+            self._load_history_page(self._cb_left)
+        self._request(self._LEFT, self._cb_left.currentData())
+        self._request_diff()
 
     def handle_right_option_change(self):
-        snapshot_hash = self._cb_right.currentData()
-        image_data = self._image.read_version(snapshot_hash)
-        pixmap = QtGui.QPixmap()
-        pixmap.loadFromData(image_data)
+        if self._cb_right.currentData() == self._MORE:
+            self._load_history_page(self._cb_right)
+        self._request(self._RIGHT, self._cb_right.currentData())
+        self._request_diff()
+
+    def _load_history_page(self, selecting: Optional[QtWidgets.QComboBox] = None):
+        """
+        Appends the next page of older snapshots to both combo boxes, followed by
+        a "more" entry if there are any left.
+
+        :param selecting: combo box whose "more" entry was picked, it selects the first new snapshot
+        """
+        page = self._image.history(self._HISTORY_PAGE_SIZE + 1, self._history_loaded)
+        has_more = len(page) > self._HISTORY_PAGE_SIZE
+        page = page[:self._HISTORY_PAGE_SIZE]
+
+        for cb in (self._cb_left, self._cb_right):
+            # the selection changes below are ours, not the user's
+            cb.blockSignals(True)
+            try:
+                more = cb.findData(self._MORE)
+                if more >= 0:
+                    cb.removeItem(more)
+
+                for item in page:
+                    cb.addItem(f"[{item['hash'][:8]}] {item['description']}", item['hash'])
+                if has_more:
+                    cb.addItem("older snapshots...", self._MORE)
+
+                if cb is selecting:
+                    cb.setCurrentIndex(cb.findData(page[0]['hash']) if page else 0)
+            finally:
+                cb.blockSignals(False)
+
+        self._history_loaded += len(page)
+
+    def handle_diff_toggle(self, checked: bool):
+        if checked:
+            self._request_diff()
+        else:
+            self._latest.pop(self._DIFF, None)
+            self._lbl_metrics.clear()
+            self._window.set_diff(None)
+
+    def _request_diff(self):
+        if self._image is None or not self._chk_diff.isChecked():
+            return
+
+        request_id = next(self._request_ids)
+        self._latest[self._DIFF] = request_id
+        self._requests[request_id] = (self._DIFF, None)
+        self._lbl_metrics.setText("...")
+
+        loader = DiffLoader(request_id, self._image, self._cb_left.currentData(), self._cb_right.currentData(),
+                            self._is_stale)
+        loader.signals.loaded.connect(self._on_diff_loaded)
+        self._pool.start(loader)
+
+    def _on_diff_loaded(self, request_id: int, result):
+        self._requests.pop(request_id)
+        if self._latest.get(self._DIFF) != request_id:
+            return
+
+        if result is None:
+            self._lbl_metrics.setText("diff failed")
+            self._window.set_diff(None)
+            return
+
+        self._lbl_metrics.setText(
+            f"PSNR {result.psnr:.2f} dB | SSIM {result.ssim:.4f} | changed {result.changed_ratio:.2%}"
+        )
+        self._window.set_diff(QtGui.QPixmap.fromImage(_heatmap_image(result.heatmap)), result.boxes)
+
+    def _request(self, side: str, snapshot_hash: Optional[str]):
+        if self._image is None:
+            return
+
+        key = self._image.version_id(snapshot_hash)
+        request_id = next(self._request_ids)
+        self._latest[side] = request_id
+        self._shown[side] = snapshot_hash
+        # a pyramid still being built for the previous version is of no use anymore
+        self._latest.pop(self._pyramid_side(side), None)
+
+        pixmap = self._cache.get(key) if key else None
+        if pixmap is not None:
+            self._apply(side, pixmap, self._widths.get(key), self._pyramids.get(key))
+            return
+
+        self._requests[request_id] = (side, key)
+        self._window.set_loading(side == self._LEFT, True)
+
+        loader = ImageLoader(request_id, self._image, snapshot_hash, self._is_stale)
+        loader.signals.loaded.connect(self._on_loaded)
+        self._pool.start(loader)
+
+    def _request_pyramid(self, left: bool):
+        if self._image is None:
+            return
+
+        side = self._LEFT if left else self._RIGHT
+        snapshot_hash = self._shown.get(side)
+        key = self._image.version_id(snapshot_hash)
+        if key in self._pyramids:
+            self._window.set_pyramid(left, self._pyramids[key])
+            return
+
+        request_id = next(self._request_ids)
+        self._latest[self._pyramid_side(side)] = request_id
+        self._requests[request_id] = (self._pyramid_side(side), key)
+
+        loader = PyramidLoader(request_id, self._image, snapshot_hash, self._is_stale)
+        loader.signals.loaded.connect(self._on_pyramid_loaded)
+        self._pool.start(loader)
+
+    def _is_stale(self, request_id: int) -> bool:
+        # called from pool threads, dict reads are atomic
+        side, _ = self._requests.get(request_id, (None, None))
+        return self._latest.get(side) != request_id
+
+    def _on_loaded(self, request_id: int, result: Optional[tuple]):
+        side, key = self._requests.pop(request_id)
+        if self._latest.get(side) != request_id:
+            return
+
+        self._window.set_loading(side == self._LEFT, False)
+        if result is None or result[0].isNull():
+            return
+
+        image, size = result
+        pixmap = QtGui.QPixmap.fromImage(image)
+        if key:
+            self._cache.put(key, pixmap)
+            self._widths[key] = size.width()
+        self._apply(side, pixmap, size.width(), self._pyramids.get(key))
+
+    def _on_pyramid_loaded(self, request_id: int, pyramid: Optional['TilePyramid']):
+        side, key = self._requests.pop(request_id)
+        if self._latest.get(side) != request_id or pyramid is None:
+            return
+
+        if key:
+            # pyramids live on disk, the handle is tiny
+            self._pyramids[key] = pyramid
+        self._window.set_pyramid(side == self._pyramid_side(self._LEFT), pyramid)
+
+    def _apply(self, side: str, pixmap: QtGui.QPixmap, width: Optional[int], pyramid: Optional['TilePyramid']):
+        self._window.set_loading(side == self._LEFT, False)
+        if side == self._LEFT:
+            self._window.set_left(pixmap, width, pyramid)
+        else:
+            self._window.set_right(pixmap, width, pyramid)
+
+    @staticmethod
+    def _pyramid_side(side: str) -> str:
+        return f"{side}_pyramid"
 
-        self._window.set_right(pixmap)
+    @property
+    def cache(self):
+        return self._cache
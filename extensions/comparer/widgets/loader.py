@@ -0,0 +1,163 @@
+import logging
+from typing import TYPE_CHECKING, Callable, Optional
+
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtCore import Qt
+
+if TYPE_CHECKING:
+    from core.imaging.pyramid import TilePyramid
+    from core.project.image import ProjectImage
+
+
+def _emit_loaded(signals: QtCore.QObject, *args):
+    try:
+        signals.loaded.emit(*args)
+    except RuntimeError:
+        # the receiving widgets (and with them the signals object) are gone, e.g. the app quit meanwhile
+        pass
+
+
+class ImageLoaderSignals(QtCore.QObject):
+    # request id, result (None on failure)
+    loaded = QtCore.pyqtSignal(int, object)
+
+
+class TileLoaderSignals(QtCore.QObject):
+    # tile key, decoded tile (None on failure or if no longer wanted)
+    loaded = QtCore.pyqtSignal(object, object)
+
+
+class ImageLoader(QtCore.QRunnable):
+    """
+    Reads and decodes one image version on a thread pool.
+
+    Emits ``(preview, size)``: the decoded ``QImage`` scaled down to at most
+    ``PREVIEW_SIZE`` pixels per side (safe off the GUI thread, the receiver
+    converts it to a ``QPixmap``) and the full ``QSize`` of the image. Formats
+    that can (e.g. JPEG) decode straight at the preview size, others are
+    decoded whole and scaled. Larger images get their tile pyramid from
+    ``PyramidLoader`` once zoomed in past the preview. ``is_stale`` is polled
+    between the read and the decode so superseded requests stop early.
+    """
+
+    PREVIEW_SIZE = 2048
+
+    def __init__(self, request_id: int, image: 'ProjectImage', snapshot_hash: Optional[str],
+                 is_stale: Callable[[int], bool]):
+        super().__init__()
+        self.signals = ImageLoaderSignals()
+
+        self._request_id = request_id
+        self._image = image
+        self._snapshot_hash = snapshot_hash
+        self._is_stale = is_stale
+
+    def run(self):
+        result = None
+        try:
+            if self._is_stale(self._request_id):
+                return
+
+            with self._image.map_version(self._snapshot_hash) as data:
+                if self._is_stale(self._request_id):
+                    return
+                buffer = QtCore.QBuffer()
+                buffer.setData(bytes(data))
+
+            reader = QtGui.QImageReader(buffer)
+            # from the header, invalid if the format can't tell before decoding
+            size = reader.size()
+            large = size.isValid() and max(size.width(), size.height()) > self.PREVIEW_SIZE
+            if large and reader.supportsOption(QtGui.QImageIOHandler.ScaledSize):
+                reader.setScaledSize(size.scaled(self.PREVIEW_SIZE, self.PREVIEW_SIZE, Qt.KeepAspectRatio))
+
+            image = reader.read()
+            if image.isNull():
+                raise ValueError(f"cannot decode version '{self._snapshot_hash}': {reader.errorString()}")
+
+            if not size.isValid():
+                size = image.size()
+            if max(image.width(), image.height()) > self.PREVIEW_SIZE:
+                image = image.scaled(self.PREVIEW_SIZE, self.PREVIEW_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            result = image, size
+        except Exception:  # noqa
+            logging.exception(f"failed to load version '{self._snapshot_hash}'")
+        finally:
+            _emit_loaded(self.signals, self._request_id, result)
+
+
+class PyramidLoader(QtCore.QRunnable):
+    """Opens the tile pyramid of one image version on a thread pool, building it on first use."""
+
+    def __init__(self, request_id: int, image: 'ProjectImage', snapshot_hash: Optional[str],
+                 is_stale: Callable[[int], bool]):
+        super().__init__()
+        self.signals = ImageLoaderSignals()
+
+        self._request_id = request_id
+        self._image = image
+        self._snapshot_hash = snapshot_hash
+        self._is_stale = is_stale
+
+    def run(self):
+        result = None
+        try:
+            if not self._is_stale(self._request_id):
+                result = self._image.pyramid(self._snapshot_hash)
+        except Exception:  # noqa
+            logging.exception(f"failed to build the pyramid of version '{self._snapshot_hash}'")
+        finally:
+            _emit_loaded(self.signals, self._request_id, result)
+
+
+class DiffLoader(QtCore.QRunnable):
+    """Computes ``core.imaging.diff_versions`` for two versions on a thread pool."""
+
+    def __init__(self, request_id: int, image: 'ProjectImage', snapshot_a: Optional[str], snapshot_b: Optional[str],
+                 is_stale: Callable[[int], bool]):
+        super().__init__()
+        self.signals = ImageLoaderSignals()
+
+        self._request_id = request_id
+        self._image = image
+        self._snapshot_a = snapshot_a
+        self._snapshot_b = snapshot_b
+        self._is_stale = is_stale
+
+    def run(self):
+        from core.imaging import diff_versions
+
+        result = None
+        try:
+            if not self._is_stale(self._request_id):
+                result = diff_versions(self._image, self._snapshot_a, self._snapshot_b)
+        except Exception:  # noqa
+            logging.exception(f"failed to diff '{self._snapshot_a}' and '{self._snapshot_b}'")
+        finally:
+            _emit_loaded(self.signals, self._request_id, result)
+
+
+class TileLoader(QtCore.QRunnable):
+    """Reads and decodes one pyramid tile on a thread pool, skipped if ``is_wanted(key)`` no longer holds."""
+
+    def __init__(self, key: tuple, pyramid: 'TilePyramid', level: int, tx: int, ty: int,
+                 is_wanted: Callable[[tuple], bool]):
+        super().__init__()
+        self.signals = TileLoaderSignals()
+
+        self._key = key
+        self._pyramid = pyramid
+        self._level = level
+        self._tx = tx
+        self._ty = ty
+        self._is_wanted = is_wanted
+
+    def run(self):
+        result = None
+        try:
+            if self._is_wanted(self._key):
+                result = self._pyramid.tile(self._level, self._tx, self._ty)
+        except Exception:  # noqa
+            logging.exception(f"failed to load tile {self._key}")
+        finally:
+            _emit_loaded(self.signals, self._key, result)
@@ -1,8 +1,30 @@
+import math
+from typing import TYPE_CHECKING, Optional
+
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtCore import Qt
 
+from core.util.lru import ByteLRUCache
+from .loader import TileLoader
+
+if TYPE_CHECKING:
+    from core.imaging.pyramid import TilePyramid
+
+
+def _pixmap_size(pixmap: QtGui.QPixmap) -> int:
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
 
 class ComparerWindowWidget(QtWidgets.QWidget):
+    # left side or not, zoomed in past the preview of an image that has no pyramid yet
+    detail_requested = QtCore.pyqtSignal(bool)
+
+    _HANDLE_RADIUS = 12
+    _LINE_WIDTH = 2
+    _RESCALE_DELAY_MS = 150
+    _MAX_ZOOM = 64.0
+    _ZOOM_STEP = 1.25
+    _TILE_CACHE_BYTES = 128 * 1024 * 1024
 
     # ----------------------- Constructor ------------------------
 
@@ -12,32 +34,150 @@ class ComparerWindowWidget(QtWidgets.QWidget):
         self._left = None
         self._right = None
 
+        # copies of the pixmaps pre-scaled to the widget, painted 1:1
+        self._scaled_left: Optional[QtGui.QPixmap] = None
+        self._scaled_right: Optional[QtGui.QPixmap] = None
+
+        # full-resolution tiles for zoomed-in views, None if only the preview is available
+        self._left_pyramid: Optional['TilePyramid'] = None
+        self._right_pyramid: Optional['TilePyramid'] = None
+        # width of the full image, larger than the pixmap's if that is a scaled-down preview
+        self._left_width = 0
+        self._right_width = 0
+        self._detail_requested = set()
+        self._tiles = ByteLRUCache(self._TILE_CACHE_BYTES, _pixmap_size)
+        # tiles are read and decoded off the GUI thread; the ones the last paint lacked, and those on their way
+        self._tile_pool = QtCore.QThreadPool(self)
+        self._tile_pool.setMaxThreadCount(2)
+        self._wanted_tiles = set()
+        self._pending_tiles = set()
+
+        # 1.0 fits the image into the widget, the normalized image point shown at the widget center
+        self._zoom = 1.0
+        self._center = QtCore.QPointF(0.5, 0.5)
+        self._pan_origin: Optional[QtCore.QPoint] = None
+
         self._position = 0.5
         self._pressed = False
 
+        self._left_loading = False
+        self._right_loading = False
+
+        # diff mode replaces the slider view with a heatmap and changed-region outlines
+        self._diff: Optional[QtGui.QPixmap] = None
+        self._scaled_diff: Optional[QtGui.QPixmap] = None
+        self._diff_boxes = []
+
+        # while the widget is being resized, smooth rescaling is deferred until it settles
+        self._rescale_timer = QtCore.QTimer(self)
+        self._rescale_timer.setSingleShot(True)
+        self._rescale_timer.setInterval(self._RESCALE_DELAY_MS)
+        self._rescale_timer.timeout.connect(self._rescale)
+
     # ---------------------- Public Methods ----------------------
 
-    def set_left(self, p: QtGui.QPixmap):
+    def set_left(self, p: QtGui.QPixmap, width: Optional[int] = None, pyramid: Optional['TilePyramid'] = None):
+        """
+        :param width: width of the full image if ``p`` is a scaled-down preview
+        :param pyramid: tiles of the full image, requested through ``detail_requested`` if needed and missing
+        """
         self._left = p
+        self._left_width = width or p.width()
+        self._left_pyramid = pyramid
+        self._scaled_left = self._scale(p)
+        self._detail_requested.discard(True)
+        self._request_detail()
         self.update()
 
-    def set_right(self, p: QtGui.QPixmap):
+    def set_right(self, p: QtGui.QPixmap, width: Optional[int] = None, pyramid: Optional['TilePyramid'] = None):
         self._right = p
+        self._right_width = width or p.width()
+        self._right_pyramid = pyramid
+        self._scaled_right = self._scale(p)
+        self._detail_requested.discard(False)
+        self._request_detail()
+        self.update()
+
+    def set_pyramid(self, left: bool, pyramid: 'TilePyramid'):
+        if left:
+            self._left_pyramid = pyramid
+        else:
+            self._right_pyramid = pyramid
+        self.update()
+
+    def set_diff(self, p: Optional[QtGui.QPixmap], boxes=()):
+        self._diff = p
+        self._scaled_diff = self._scale(p)
+        self._diff_boxes = list(boxes)
+        self.update()
+
+    def set_loading(self, left: bool, loading: bool):
+        if left:
+            self._left_loading = loading
+        else:
+            self._right_loading = loading
+        self.update()
+
+    def set_zoom(self, zoom: float, anchor: Optional[QtCore.QPoint] = None):
+        """
+        :param zoom: 1.0 fits the image into the widget
+        :param anchor: widget point that stays on the same image point, the center by default
+        """
+        zoom = min(max(zoom, 1.0), self._MAX_ZOOM)
+        if self._left is None or zoom == self._zoom:
+            return
+
+        if anchor is not None:
+            rect = self._get_rect(self._left)
+            u = (anchor.x() - rect.x()) / rect.width()
+            v = (anchor.y() - rect.y()) / rect.height()
+
+            fit = self._fit_rect(self._left)
+            width, height = fit.width() * zoom, fit.height() * zoom
+            self._center = QtCore.QPointF(
+                (self.width() / 2 - anchor.x()) / width + u, (self.height() / 2 - anchor.y()) / height + v
+            )
+
+        self._zoom = zoom
+        self._clamp_center()
+        self._request_detail()
+        self.update()
+
+    def reset_zoom(self):
+        self._zoom = 1.0
+        self._center = QtCore.QPointF(0.5, 0.5)
         self.update()
 
     # -------------- Protected and Private Methods ---------------
 
     def _update_position(self, x):
-        rect = self._get_rect(self._left)
+        if self._left is None or self._diff is not None:
+            return
 
-        new_position = min(max((x - rect.x()) / rect.width(), 0), 1)
+        view = self._get_view(self._get_rect(self._left))
+
+        new_position = min(max((x - view.x()) / view.width(), 0), 1)
         new_position = round(new_position, 4)
 
         if new_position != self._position:
+            old_x = self._get_split_x(view)
             self._position = new_position
-            self.update()
+            new_x = self._get_split_x(view)
 
-    def _get_rect(self, pixmap: QtGui.QPixmap):
+            # only the strip the divider and its handle moved across needs repainting
+            margin = self._HANDLE_RADIUS + self._LINE_WIDTH
+            self.update(QtCore.QRect(
+                min(old_x, new_x) - margin, view.y(), abs(new_x - old_x) + 2 * margin, view.height()
+            ))
+
+    def _get_split_x(self, view: QtCore.QRect) -> int:
+        return view.x() + int(view.width() * self._position)
+
+    def _get_view(self, rect: QtCore.QRect) -> QtCore.QRect:
+        # the divider spans the visible part of the image, which is all of it unless zoomed in
+        return rect.intersected(self.rect())
+
+    def _fit_rect(self, pixmap: QtGui.QPixmap):
         width = pixmap.width()
         height = pixmap.height()
 
@@ -55,47 +195,249 @@ class ComparerWindowWidget(QtWidgets.QWidget):
 
         return QtCore.QRect((self_width - new_width) // 2, (self_height - new_height) // 2, new_width, new_height)
 
+    def _get_rect(self, pixmap: QtGui.QPixmap):
+        rect = self._fit_rect(pixmap)
+        if self._zoom == 1.0:
+            return rect
+
+        width, height = round(rect.width() * self._zoom), round(rect.height() * self._zoom)
+        return QtCore.QRect(
+            round(self.width() / 2 - self._center.x() * width), round(self.height() / 2 - self._center.y() * height),
+            width, height
+        )
+
+    def _clamp_center(self):
+        if self._left is None:
+            return
+
+        fit = self._fit_rect(self._left)
+        center = []
+        for value, size, self_size in ((self._center.x(), fit.width(), self.width()),
+                                       (self._center.y(), fit.height(), self.height())):
+            half = self_size / (2 * size * self._zoom) if size else 0.5
+            # an image smaller than the widget stays centered, a larger one can't be panned past its edges
+            center.append(0.5 if half >= 0.5 else min(max(value, half), 1 - half))
+
+        self._center = QtCore.QPointF(*center)
+
+    def _scale(self, pixmap: Optional[QtGui.QPixmap]) -> Optional[QtGui.QPixmap]:
+        if pixmap is None or pixmap.isNull():
+            return None
+
+        ratio = self.devicePixelRatioF()
+        size = self._fit_rect(pixmap).size() * ratio
+        if size.isEmpty():
+            return None
+
+        scaled = pixmap.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        scaled.setDevicePixelRatio(ratio)
+        return scaled
+
+    def _rescale(self):
+        self._scaled_left = self._scale(self._left)
+        self._scaled_right = self._scale(self._right)
+        self._scaled_diff = self._scale(self._diff)
+        self._clamp_center()
+        self._request_detail()
+        self.update()
+
+    def _request_detail(self):
+        # previews are enough until they would be shown magnified
+        if self._zoom == 1.0:
+            return
+
+        ratio = self.devicePixelRatioF()
+        for left, pixmap, width, pyramid in ((True, self._left, self._left_width, self._left_pyramid),
+                                             (False, self._right, self._right_width, self._right_pyramid)):
+            if pixmap is None or pyramid is not None or width <= pixmap.width() or left in self._detail_requested:
+                continue
+            if self._get_rect(pixmap).width() * ratio > pixmap.width():
+                self._detail_requested.add(left)
+                self.detail_requested.emit(left)
+
+    def _is_scaled_for(self, scaled: Optional[QtGui.QPixmap], rect: QtCore.QRect) -> bool:
+        return scaled is not None and scaled.size() == rect.size() * self.devicePixelRatioF()
+
+    def _paint_image(self, painter: QtGui.QPainter, pixmap: QtGui.QPixmap, scaled: Optional[QtGui.QPixmap],
+                     pyramid: Optional['TilePyramid'], rect: QtCore.QRect, clip: QtCore.QRect):
+        if self._is_scaled_for(scaled, rect):
+            painter.drawPixmap(rect.topLeft(), scaled)
+        elif pyramid is not None and self._zoom > 1.0:
+            self._paint_tiles(painter, pixmap, pyramid, rect, clip)
+        elif self._zoom > 1.0:
+            # the full image if it is small, its preview until the tiles are there otherwise
+            painter.save()
+            painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+            painter.drawPixmap(rect, pixmap)
+            painter.restore()
+        else:
+            # mid-resize: stretch whatever we have without smoothing, the timer rescales properly
+            painter.drawPixmap(rect, scaled or pixmap)
+
+    def _paint_tiles(self, painter: QtGui.QPainter, preview: QtGui.QPixmap, pyramid: 'TilePyramid',
+                     rect: QtCore.QRect, clip: QtCore.QRect):
+        level = pyramid.level_for_scale(rect.width() * self.devicePixelRatioF() / pyramid.width)
+        level_width, level_height = pyramid.level_size(level)
+        sx, sy = rect.width() / level_width, rect.height() / level_height
+
+        # only tiles under the repainted part of the visible image are read
+        visible = clip.intersected(rect).intersected(self.rect())
+        if visible.isEmpty():
+            return
+
+        x0, y0 = math.floor((visible.left() - rect.x()) / sx), math.floor((visible.top() - rect.y()) / sy)
+        x1, y1 = math.ceil((visible.right() + 1 - rect.x()) / sx), math.ceil((visible.bottom() + 1 - rect.y()) / sy)
+
+        tiles = []
+        missing = False
+        for tx, ty in pyramid.tiles_in(level, QtCore.QRect(x0, y0, x1 - x0, y1 - y0)):
+            key = (pyramid.path, level, tx, ty)
+            tile = self._tiles.get(key)
+            if tile is None:
+                self._request_tile(key, pyramid, level, tx, ty)
+                missing = True
+            else:
+                tiles.append((tx, ty, tile))
+
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        if missing:
+            # the magnified preview stands in for the tiles still loading
+            painter.drawPixmap(rect, preview)
+
+        for tx, ty, tile in tiles:
+            tile_rect = pyramid.tile_rect(level, tx, ty)
+            painter.drawPixmap(QtCore.QRectF(
+                rect.x() + tile_rect.x() * sx, rect.y() + tile_rect.y() * sy,
+                tile_rect.width() * sx, tile_rect.height() * sy
+            ), tile, QtCore.QRectF(tile.rect()))
+
+    def _request_tile(self, key: tuple, pyramid: 'TilePyramid', level: int, tx: int, ty: int):
+        self._wanted_tiles.add(key)
+        if key in self._pending_tiles:
+            return
+
+        self._pending_tiles.add(key)
+        # read from the pool, tiles scrolled or zoomed away by then are skipped
+        loader = TileLoader(key, pyramid, level, tx, ty, lambda k: k in self._wanted_tiles)
+        loader.signals.loaded.connect(self._on_tile_loaded)
+        self._tile_pool.start(loader)
+
+    def _on_tile_loaded(self, key: tuple, image: Optional[QtGui.QImage]):
+        self._pending_tiles.discard(key)
+        if image is None or image.isNull():
+            return
+
+        self._tiles.put(key, QtGui.QPixmap.fromImage(image))
+        self.update()
+
+    def _paint_diff(self, painter: QtGui.QPainter):
+        rect = self._fit_rect(self._diff)
+        if self._is_scaled_for(self._scaled_diff, rect):
+            painter.drawPixmap(rect.topLeft(), self._scaled_diff)
+        else:
+            painter.drawPixmap(rect, self._scaled_diff or self._diff)
+
+        scale = rect.width() / self._diff.width()
+        painter.setPen(QtGui.QPen(QtGui.QColor('cyan'), 1))
+        painter.setBrush(Qt.NoBrush)
+        for x, y, width, height in self._diff_boxes:
+            painter.drawRect(QtCore.QRectF(
+                rect.x() + x * scale, rect.y() + y * scale, width * scale, height * scale
+            ))
+
     # ----------------- Overrides and Interfaces -----------------
 
     def paintEvent(self, e):
+        if self._diff is not None:
+            painter = QtGui.QPainter(self)
+            painter.setClipRect(e.rect())
+            self._paint_diff(painter)
+            return
+
         if self._left is None or self._right is None:
+            if self._left_loading or self._right_loading:
+                painter = QtGui.QPainter(self)
+                painter.setPen(QtGui.QColor('white'))
+                painter.drawText(self.rect(), Qt.AlignCenter, "Loading...")
             return
 
         painter = QtGui.QPainter(self)
+        painter.setClipRect(e.rect())
+
         brush = QtGui.QBrush()
         brush.setColor(QtGui.QColor('white'))
         brush.setStyle(Qt.SolidPattern)
 
-        painter.setRenderHint(QtGui.QPainter.Antialiasing)
-        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
-        painter.setRenderHint(QtGui.QPainter.LosslessImageRendering)
-
-        painter.drawPixmap(self._get_rect(self._right), self._right)
+        if e.rect().contains(self.rect()):
+            # what a full repaint lacks is all that is still wanted, partial ones only add to it
+            self._wanted_tiles = set()
 
+        right_rect = self._get_rect(self._right)
         rect = self._get_rect(self._left)
-        rect_width = rect.width()
-        rect_height = rect.height()
+        view = self._get_view(rect)
+        split_x = self._get_split_x(view)
+
+        self._paint_image(painter, self._right, self._scaled_right, self._right_pyramid, right_rect, e.rect())
 
-        rect.setWidth(round(rect_width * self._position))
+        left_clip = QtCore.QRect(view.x(), view.y(), split_x - view.x(), view.height()).intersected(e.rect())
+        if not left_clip.isEmpty():
+            painter.save()
+            painter.setClipRect(left_clip)
+            self._paint_image(painter, self._left, self._scaled_left, self._left_pyramid, rect, left_clip)
+            painter.restore()
 
-        painter.drawPixmap(rect, self._left, QtCore.QRect(
-            0, 0, int(self._left.width() * self._position), self._left.height()
-        ))
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
 
-        line = QtCore.QRect(rect.x() + int(rect_width * self._position), rect.y(), 2, rect.height())
+        line = QtCore.QRect(split_x, view.y(), self._LINE_WIDTH, view.height())
         painter.fillRect(line, brush)
 
-        center = QtCore.QPoint(rect.x() + int(rect_width * self._position) + 1, rect.y() + rect_height // 2)
+        center = QtCore.QPoint(split_x + 1, view.y() + view.height() // 2)
         painter.setBrush(brush)
-        painter.drawEllipse(center, 12, 12)
+        painter.drawEllipse(center, self._HANDLE_RADIUS, self._HANDLE_RADIUS)
+
+        # keep showing the previous version under a placeholder while the new one loads
+        painter.setPen(QtGui.QColor('white'))
+        if self._left_loading:
+            painter.drawText(view.adjusted(8, 8, 0, 0), Qt.AlignLeft | Qt.AlignTop, "Loading...")
+        if self._right_loading:
+            painter.drawText(self._get_view(right_rect).adjusted(0, 8, -8, 0), Qt.AlignRight | Qt.AlignTop,
+                             "Loading...")
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        self._rescale_timer.start()
+
+    def wheelEvent(self, e):
+        steps = e.angleDelta().y() / 120
+        if steps and self._diff is None:
+            self.set_zoom(self._zoom * self._ZOOM_STEP ** steps, e.pos())
+
+    def mouseDoubleClickEvent(self, e):
+        self.reset_zoom()
 
     def mousePressEvent(self, e):
+        # left drags the divider, the other buttons pan a zoomed-in view
+        if e.button() != Qt.LeftButton:
+            self._pan_origin = e.pos()
+            return
+
         self._pressed = True
         self._update_position(e.x())
 
     def mouseReleaseEvent(self, a0):
         self._pressed = False
+        self._pan_origin = None
 
     def mouseMoveEvent(self, a0):
-        if self._pressed:
+        if self._pan_origin is not None and self._left is not None and self._zoom > 1.0:
+            rect = self._get_rect(self._left)
+            delta = a0.pos() - self._pan_origin
+            self._pan_origin = a0.pos()
+
+            self._center = QtCore.QPointF(
+                self._center.x() - delta.x() / rect.width(), self._center.y() - delta.y() / rect.height()
+            )
+            self._clamp_center()
+            self.update()
+        elif self._pressed:
             self._update_position(a0.x())
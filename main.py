@@ -1,112 +1,237 @@
+import argparse
+import concurrent.futures
+import hashlib
+import importlib
 import inspect
 import logging
 import os
+import subprocess
 import sys
+from functools import partial
 from glob import glob
 from pathlib import Path
+from typing import List, Optional, Tuple
 
+import ujson
 from PyQt5 import QtWidgets
 from qt_material import apply_stylesheet
 
 from core.api import KairyoApi
-from core.extension import KairyoExtension
+from core.extension import ExtensionManifest, KairyoExtension
 from core.user_interface import UserInterface
+from core.util.trace import tracer
 
 
-def compile_ui():
-    logging.info("compiling ui...")
+_MANIFEST_FILENAME = ".compiled.json"
+
+
+def _sha256(fn: str) -> Optional[str]:
+    try:
+        with open(fn, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _find_ui_sources() -> List[Tuple[str, str, List[str]]]:
+    """:return: (source, output, command) for every *.ui and *.qrc file"""
+    sources = []
 
     # Ui Files
     for fn in glob("./**/resources/*.ui", recursive=True):
         fn = Path(fn)
-        logging.info(f"found *.ui file in {fn}...")
+        basename = os.path.splitext(fn.name)[0]
+        output = fn.parent.parent.absolute() / "generated" / f"{basename}.py"
+        sources.append((str(fn.absolute()), str(output), ["pyuic5", "--import-from=."]))
 
-        parent = fn.parent.parent.absolute()
+    # Resources
+    for fn in glob("./**/resources/*.qrc", recursive=True):
+        fn = Path(fn)
         basename = os.path.splitext(fn.name)[0]
+        output = fn.parent.parent.absolute() / "generated" / f"{basename}_rc.py"
+        sources.append((str(fn.absolute()), str(output), ["pyrcc5"]))
 
-        generated = os.path.join(parent, "generated")
-        os.makedirs(generated, exist_ok=True)
+    return sources
 
-        output = os.path.join(generated, f"{basename}.py")
 
-        cmd = f"pyuic5 {fn.absolute()} -o {Path(output).absolute()} --import-from=."
-        os.system(cmd)
+def _load_manifest(fn: str) -> dict:
+    try:
+        with open(fn, encoding="utf-8") as f:
+            return ujson.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
 
-    # Resources
-    for fn in glob("./**/resources/*.qrc", recursive=True):
-        fn = Path(fn)
-        logging.info(f"found *.qrc file in {fn}...")
 
-        parent = fn.parent.parent.absolute()
-        basename = os.path.splitext(fn.name)[0]
+def _run_compiler(source: str, output: str, command: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [command[0], source, "-o", output, *command[1:]], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+
+@tracer.traced("startup.compile_ui")
+def compile_ui(workers: Optional[int] = None):
+    """
+    Compiles *.ui and *.qrc files into their package's generated/ directory.
 
-        generated = os.path.join(parent, "generated")
+    Every generated/ directory keeps a manifest with the hashes of the source,
+    the command and the output of each file; a file is only recompiled if one
+    of them changed or the output is gone. Compilers run in parallel.
+
+    :raise RuntimeError: if any file failed to compile
+    """
+    logging.info("compiling ui...")
+
+    manifests = {}
+    pending = []
+    for source, output, command in _find_ui_sources():
+        generated = os.path.dirname(output)
+        manifest_fn = os.path.join(generated, _MANIFEST_FILENAME)
+        if manifest_fn not in manifests:
+            manifests[manifest_fn] = _load_manifest(manifest_fn)
+
+        entry = {'source': _sha256(source), 'command': command}
+        recorded = manifests[manifest_fn].get(os.path.basename(output))
+        if recorded is not None and recorded == dict(entry, output=_sha256(output)):
+            continue
+
+        logging.info(f"found changed {os.path.splitext(source)[1]} file in {source}...")
         os.makedirs(generated, exist_ok=True)
+        pending.append((source, output, command, manifest_fn, entry))
 
-        output = os.path.join(generated, f"{basename}_rc.py")
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {executor.submit(_run_compiler, *job[:3]): job for job in pending}
 
-        cmd = f"pyrcc5 {fn.absolute()} -o {Path(output).absolute()}"
-        os.system(cmd)
+        for future in concurrent.futures.as_completed(futures):
+            source, output, command, manifest_fn, entry = futures[future]
+            try:
+                result = future.result()
+            except OSError as e:
+                logging.error(f"cannot run {command[0]} for {source}: {e}")
+                failed.append(source)
+                continue
 
-    logging.info("ui compiled")
+            if result.returncode != 0:
+                logging.error(f"{command[0]} failed for {source} ({result.returncode}):\n{result.stderr.strip()}")
+                failed.append(source)
+                continue
 
+            manifests[manifest_fn][os.path.basename(output)] = dict(entry, output=_sha256(output))
 
-def load_extensions(api: KairyoApi):
-    logging.info("loading extensions...")
+    for manifest_fn, manifest in manifests.items():
+        with open(manifest_fn, "w", encoding="utf-8") as f:
+            ujson.dump(manifest, f, indent=2)
 
-    for ext in os.listdir("./extensions"):
-        fn = os.path.join("./extensions", ext, f"{ext}.py")
+    if failed:
+        raise RuntimeError(f"{len(failed)} ui file(s) failed to compile: {', '.join(failed)}")
 
-        if not os.path.isfile(fn):
-            continue
+    logging.info(f"ui compiled ({len(pending)} changed)")
 
-        with open(fn, encoding="utf-8") as f:
-            code = compile(f.read(), fn, "exec")
 
-            tmp = {}
-            exec(code, tmp)
+def _find_extension_class(module) -> Optional[type]:
+    for item in vars(module).values():
+        if inspect.isclass(item) and issubclass(item, KairyoExtension) and item != KairyoExtension:
+            return item
+    return None
+
 
-            for item in tmp.values():
-                if not inspect.isclass(item):
-                    continue
+def _activate_extension(api: KairyoApi, manifest: ExtensionManifest):
+    logging.info(f"loading {manifest.class_name}...")
+    try:
+        with tracer.span("extension.import", extension=manifest.name):
+            cls = getattr(importlib.import_module(manifest.module), manifest.class_name)
+            ext = cls(api)
+        api.register_extension(ext)
 
-                if issubclass(item, KairyoExtension) and item != KairyoExtension:
-                    logging.info(f"loading {item.__name__}...")
-                    api.register_extension(item(api))
+        with tracer.span("extension.on_start", extension=manifest.name):
+            ext.on_start()
+    except Exception:  # noqa
+        logging.exception(f"failed to activate extension \"{manifest.name}\"")
 
-    logging.info(f"extensions loaded: {len(api.extensions)}")
 
+@tracer.traced("startup.load_extensions")
+def load_extensions(api: KairyoApi):
+    """
+    Loads ``extensions/<name>/`` through ``importlib`` (cached bytecode, one
+    module per extension in ``sys.modules``).
+
+    Extensions with an ``extension.json`` are activated as their manifest says,
+    ``"tab"`` ones are only imported once their tab is opened. Others fall back
+    to the first ``KairyoExtension`` subclass in ``<name>.py``, activated at
+    startup.
+    """
+    logging.info("loading extensions...")
 
-def start_app():
+    activate = []
+    for ext in sorted(os.listdir("./extensions")):
+        path = os.path.join("./extensions", ext)
+
+        if os.path.isfile(os.path.join(path, ExtensionManifest.FILENAME)):
+            try:
+                manifest = ExtensionManifest.load(path)
+            except (KeyError, IndexError, ValueError):
+                logging.exception(f"invalid manifest in {path}")
+                continue
+        elif os.path.isfile(os.path.join(path, f"{ext}.py")):
+            cls = _find_extension_class(importlib.import_module(f"extensions.{ext}.{ext}"))
+            if cls is None:
+                continue
+            manifest = ExtensionManifest(ext, f"extensions.{ext}", f"{ext}:{cls.__name__}")
+        else:
+            continue
+
+        if manifest.activation == ExtensionManifest.ACTIVATION_TAB:
+            logging.info(f"deferring {manifest.name} until its tab is opened...")
+            api.user_interface.register_placeholder_tab(manifest.tab, partial(_activate_extension, api, manifest))
+        else:
+            activate.append(manifest)
+
+    for manifest in activate:
+        _activate_extension(api, manifest)
+
+    logging.info(f"extensions loaded: {len(api.extensions)} ({len(activate)} at startup)")
+
+
+def start_app(argv: Optional[List[str]] = None):
     from mainwindow import MainWindow
 
-    app = QtWidgets.QApplication(sys.argv)
-    apply_stylesheet(app, theme='dark_teal.xml', extra={
-        # Density Scale
-        'density_scale': '-1',
-    })
+    app = QtWidgets.QApplication(sys.argv if argv is None else argv)
+    with tracer.span("startup.apply_stylesheet"):
+        apply_stylesheet(app, theme='dark_teal.xml', extra={
+            # Density Scale
+            'density_scale': '-1',
+        })
 
     # app.setStyleSheet(qdarkgraystyle.load_stylesheet())
 
-    window = MainWindow()
+    with tracer.span("startup.main_window"):
+        window = MainWindow()
 
     api = KairyoApi(
         user_interface=UserInterface(window)
     )
     load_extensions(api)
 
-    for ext in api.extensions:
-        ext.on_start()
-
     window.show()
     app.exec_()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-compile", action="store_true",
+                        help="use the generated ui modules as they are (packaged deployments)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace of startup and instrumented calls to FILE on exit")
+    args, qt_args = parser.parse_known_args()
+
+    if args.trace:
+        tracer.enable(args.trace)
+
     logging.basicConfig(
         format="%(asctime)s | %(levelname)7s | %(name)16s | %(module)s.%(funcName)s.%(lineno)d: %(message)s",
         level=logging.INFO
     )
 
-    compile_ui()
-    start_app()
+    if not args.no_compile:
+        compile_ui()
+    start_app(sys.argv[:1] + qt_args)
@@ -0,0 +1,70 @@
+import os
+import stat
+
+from core.vcs import Repository
+
+
+def _snapshot(tmp_path):
+    repo = Repository(str(tmp_path))
+    for name in ("a.bin", "b.bin", "c.bin"):
+        (tmp_path / name).write_bytes(os.urandom(10_000))
+    repo.save_snapshot("first")
+    return repo
+
+
+def _corrupt(fn: str, offset: int = 0):
+    os.chmod(fn, stat.S_IRUSR | stat.S_IWUSR)
+    with open(fn, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+
+def test_clean(tmp_path):
+    repo = _snapshot(tmp_path)
+
+    progress = []
+    result = repo.fsck(workers=2, progress=lambda checked, total: progress.append((checked, total)))
+    assert result.ok
+    assert result.checked == 3
+    assert progress[-1] == (3, 3)
+
+
+def test_flags_corrupt_blob(tmp_path):
+    repo = _snapshot(tmp_path)
+    file_id = repo.file_id(tmp_path / "b.bin", repo.current)
+    _corrupt(repo.store.loose_path(file_id), 5000)
+
+    result = repo.fsck(workers=2)
+    assert not result.ok
+    assert result.corrupt == [file_id]
+    assert result.missing == []
+
+
+def test_flags_corrupt_packed_blob(tmp_path):
+    repo = _snapshot(tmp_path)
+    file_id = repo.file_id(tmp_path / "c.bin", repo.current)
+    repo.repack()
+
+    # the pack holds the blobs back to back, damage the byte that is unique to this one
+    with repo.open_file(tmp_path / "c.bin", repo.current) as f:
+        content = f.read()
+    pack_fn = repo.store.packs[0].pack_path
+    with open(pack_fn, 'rb') as f:
+        offset = f.read().index(content)
+    _corrupt(pack_fn, offset + 5000)
+
+    result = repo.fsck(workers=2)
+    assert result.corrupt == [file_id]
+
+
+def test_flags_missing_blob(tmp_path):
+    repo = _snapshot(tmp_path)
+    file_id = repo.file_id(tmp_path / "a.bin", repo.current)
+    os.unlink(repo.store.loose_path(file_id))
+
+    result = repo.fsck(workers=2)
+    assert result.missing == [file_id]
+    assert result.corrupt == []
+    assert result.checked == 2
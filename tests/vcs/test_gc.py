@@ -0,0 +1,81 @@
+import os
+import time
+
+from core.vcs import BlobStore, Repository, codec
+
+
+def _ingest(store: BlobStore, tmp_path, content: bytes, base=None) -> str:
+    fn = tmp_path / "input"
+    fn.write_bytes(content)
+    return store.ingest(str(fn), base)
+
+
+def _age(store: BlobStore, file_id: str, seconds: float):
+    t = time.time() - seconds
+    for fn in (store.loose_path(file_id), store.loose_path(file_id) + ".blob"):
+        if os.path.exists(fn):
+            os.utime(fn, (t, t))
+
+
+def test_keeps_delta_bases(tmp_path):
+    store = BlobStore(str(tmp_path / "store"), delta=True)
+    content = os.urandom(codec.DELTA_BLOCK_SIZE * 16)
+    base = _ingest(store, tmp_path, content)
+    target = _ingest(store, tmp_path, content + b"appended", base)
+    unused = _ingest(store, tmp_path, os.urandom(100))
+    assert store.info(target)['base'] == base
+
+    assert store.remove_unreachable([target], min_age=0) == 1
+    assert set(store.iter_blobs()) == {base, target}
+    with store.open(target) as f:
+        assert f.read() == content + b"appended"
+    assert not store.contains(unused)
+
+
+def test_keeps_delta_bases_in_packs(tmp_path):
+    store = BlobStore(str(tmp_path / "store"), delta=True)
+    content = os.urandom(codec.DELTA_BLOCK_SIZE * 16)
+    base = _ingest(store, tmp_path, content)
+    target = _ingest(store, tmp_path, content + b"appended", base)
+    unused = _ingest(store, tmp_path, os.urandom(100))
+    store.repack()
+
+    assert store.remove_unreachable([target], min_age=0) == 1
+    assert set(store.iter_blobs()) == {base, target}
+    with store.open(target) as f:
+        assert f.read() == content + b"appended"
+
+
+def test_keeps_blobs_under_min_age(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    kept = _ingest(store, tmp_path, b"kept")
+    recent = _ingest(store, tmp_path, b"recent")
+    old = _ingest(store, tmp_path, b"old")
+    _age(store, old, 120)
+
+    assert store.remove_unreachable([kept], min_age=60) == 1
+    assert set(store.iter_blobs()) == {kept, recent}
+
+
+def test_repository_gc(tmp_path):
+    repo = Repository(str(tmp_path))
+    repo.set_storage(codec.CODEC_ZLIB, delta=True)
+    content = os.urandom(codec.DELTA_BLOCK_SIZE * 16)
+    (tmp_path / "a.bin").write_bytes(content)
+    repo.save_snapshot("first")
+    first = repo.current
+    (tmp_path / "a.bin").write_bytes(content + b"appended")
+    repo.save_snapshot("second")
+
+    # e.g. left behind by an abandoned snapshot
+    abandoned = _ingest(repo.store, tmp_path / ".vcs", os.urandom(100))
+
+    assert repo.gc() == 0
+    assert repo.store.contains(abandoned)
+
+    assert repo.gc(min_age=0) == 1
+    assert not repo.store.contains(abandoned)
+    for snapshot_hash, expected in ((first, content), (repo.current, content + b"appended")):
+        with repo.open_file(tmp_path / "a.bin", snapshot_hash) as f:
+            assert f.read() == expected
+    assert repo.fsck(workers=1).ok
@@ -0,0 +1,42 @@
+from core.vcs import Repository, SnapshotLog
+
+
+def test_reopen(tmp_path):
+    repo = Repository(str(tmp_path))
+    (tmp_path / "a.txt").write_bytes(b"one")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.txt").write_bytes(b"two")
+    repo.save_snapshot("first")
+    first = repo.current
+
+    (tmp_path / "a.txt").write_bytes(b"three")
+    repo.save_snapshot("second")
+    second = repo.current
+
+    log = SnapshotLog(str(tmp_path / ".vcs"))
+    assert len(log) == 2
+    assert [header['hash'] for header in log.page()] == [second, first]
+    assert log.header(second)['parent'] == first
+    assert [child['hash'] for child in log.children(first)] == [second]
+    assert log.get(first)['tree'] == repo.get_snapshot(first)['tree']
+
+    repo = Repository(str(tmp_path))
+    assert repo.current == second
+    assert [header['description'] for header in repo.history()] == ["second", "first"]
+    with repo.open_file(tmp_path / "a.txt", first) as f:
+        assert f.read() == b"one"
+    with repo.open_file(tmp_path / "sub" / "b.txt", second) as f:
+        assert f.read() == b"two"
+    assert repo.diff(first, second).modified == [repo.normpath(tmp_path / "a.txt")]
+
+
+def test_reopen_sees_appends_of_other_handle(tmp_path):
+    repo = Repository(str(tmp_path))
+    log = SnapshotLog(str(tmp_path / ".vcs"))
+
+    (tmp_path / "a.txt").write_bytes(b"one")
+    repo.save_snapshot("first")
+
+    log.refresh()
+    assert repo.current in log
+    assert log.latest()['hash'] == repo.current
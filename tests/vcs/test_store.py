@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from core.vcs import BlobStore, codec
+
+
+def _ingest(store: BlobStore, tmp_path, content: bytes, base=None) -> str:
+    fn = tmp_path / "input"
+    fn.write_bytes(content)
+    return store.ingest(str(fn), base)
+
+
+def _read(store: BlobStore, file_id: str) -> bytes:
+    with store.open(file_id) as f:
+        return f.read()
+
+
+def test_pack_round_trip(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    contents = [os.urandom(size) for size in (0, 1, 4096, 100_000)]
+    file_ids = [_ingest(store, tmp_path, content) for content in contents]
+
+    assert store.repack() == len(contents)
+    assert list(store.iter_loose()) == []
+    assert set(store.iter_blobs()) == set(file_ids)
+
+    # read back from the pack, by this store and by a freshly opened one
+    for store in (store, BlobStore(str(tmp_path / "store"))):
+        for file_id, content in zip(file_ids, contents):
+            assert store.contains(file_id)
+            assert _read(store, file_id) == content
+            assert bytes(store.map(file_id)) == content
+
+
+@pytest.mark.parametrize("compression", [codec.CODEC_ZLIB, codec.CODEC_LZMA])
+def test_record_round_trip(tmp_path, compression):
+    store = BlobStore(str(tmp_path / "store"), compression)
+    content = b"compressible " * 100_000
+    file_id = _ingest(store, tmp_path, content)
+
+    info = store.info(file_id)
+    assert info['compression'] == compression
+    assert info['raw_size'] == len(content)
+    assert info['stored_size'] < len(content)
+    assert _read(store, file_id) == content
+
+    store.repack()
+    assert _read(store, file_id) == content
+
+    checkout_fn = tmp_path / "checkout"
+    store.checkout(file_id, str(checkout_fn))
+    assert checkout_fn.read_bytes() == content
+
+
+def test_incompressible_blob_stays_raw(tmp_path):
+    store = BlobStore(str(tmp_path / "store"), codec.CODEC_ZLIB)
+    content = os.urandom(10_000)
+    file_id = _ingest(store, tmp_path, content)
+
+    assert store.info(file_id)['compression'] == codec.CODEC_NONE
+    assert _read(store, file_id) == content
+
+
+def test_delta_chain_round_trip(tmp_path):
+    store = BlobStore(str(tmp_path / "store"), delta=True)
+    block = codec.DELTA_BLOCK_SIZE
+    versions = [os.urandom(block * 64)]
+    for i in range(3):
+        # edit one block in place and append one
+        content = bytearray(versions[-1])
+        content[i * block:(i + 1) * block] = os.urandom(block)
+        versions.append(bytes(content) + os.urandom(block))
+
+    file_ids = []
+    for content in versions:
+        file_ids.append(_ingest(store, tmp_path, content, file_ids[-1] if file_ids else None))
+
+    assert [store.info(file_id)['depth'] for file_id in file_ids] == [0, 1, 2, 3]
+    assert store.info(file_ids[-1])['base'] == file_ids[-2]
+    assert store.with_bases(file_ids[-1:]) == set(file_ids)
+
+    for file_id, content in zip(file_ids, versions):
+        assert _read(store, file_id) == content
+
+    store.repack(full=True)
+    store = BlobStore(str(tmp_path / "store"))
+    for file_id, content in zip(file_ids, versions):
+        assert _read(store, file_id) == content